@@ -1,12 +1,14 @@
 from gorrabot import server
-from gorrabot.worker_factory import Worker, buffer
-from gorrabot.config import config
+from gorrabot.bootstrap import bootstrap
+from gorrabot.worker_factory import buffer, start_workers
+from gorrabot.config import refresh_config
 
 from gorrabot.timer import GorrabotTimer
 from gorrabot.event_handling import handle_event
 
-GorrabotTimer(config.cache_clear, 1800)  # execute every 30 minutes
-Worker(buffer=buffer, handler=handle_event)
+bootstrap()
+GorrabotTimer(refresh_config, 300)  # check for config changes every 5 minutes
+start_workers(buffer, handle_event)
 app = server.app
 
 
@@ -0,0 +1,283 @@
+"""In-memory stand-ins of the GitLab and Slack APIs, served over HTTP.
+
+They implement only the endpoints gorrabot uses, with enough behaviour to
+run the event handlers: updates are stored and returned by later reads,
+notes and merge requests can be created, and lists are paginated like
+GitLab does. Every response is delayed by the configured latency.
+"""
+import datetime
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+def api_date(date: datetime.datetime = None) -> str:
+    return (date or datetime.datetime.utcnow()).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class FakeService:
+    """Routes are (method, regex, handler). Handlers get the match groups,
+    the query and the JSON body, and return (status, data)"""
+
+    def __init__(self, latency: float = 0, jitter: float = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.routes = []
+        self.server = None
+
+    def route(self, method: str, pattern: str, handler):
+        self.routes.append((method, re.compile(pattern + '$'), handler))
+
+    def handle(self, method: str, path: str, query: dict, body):
+        with self.lock:
+            self.calls += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                with self.lock:
+                    return handler(*[unquote(group) for group in match.groups()], query=query, body=body)
+        return 404, {'message': '404 Not found'}
+
+    def start(self) -> str:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Otherwise keep-alive responses wait for delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _dispatch(self):
+                url = urlparse(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                raw_body = self.rfile.read(length) if length else b''
+                body = json.loads(raw_body) if raw_body.startswith(b'{') else {}
+                status, data = service.handle(self.command, url.path, query, body)
+                headers = {}
+                if isinstance(data, list):
+                    data, headers = service.paginate(data, query)
+                payload = json.dumps(data).encode()
+                if self.command == 'GET' and status == 200:
+                    # GitLab sends weak ETags and honors If-None-Match
+                    headers['ETag'] = f'W/"{hashlib.sha1(payload).hexdigest()}"'
+                    if self.headers.get('If-None-Match') == headers['ETag']:
+                        status, payload = 304, b''
+                self.send_response(status)
+                if payload:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def paginate(self, items: list, query: dict):
+        per_page = int(query.get('per_page', 20))
+        page = int(query.get('page', 1))
+        total_pages = max(1, -(-len(items) // per_page))
+        headers = {
+            'X-Total-Pages': str(total_pages),
+            'X-Next-Page': str(page + 1) if page < total_pages else '',
+            'RateLimit-Remaining': '100000',
+            'RateLimit-Reset': str(int(time.time()) + 60),
+        }
+        return items[(page - 1) * per_page:page * per_page], headers
+
+
+class FakeGitlab(FakeService):
+
+    def __init__(self, bot_username: str, **kwargs):
+        super().__init__(**kwargs)
+        self.bot_username = bot_username
+        self.projects = {}
+        self.issues = {}
+        self.merge_requests = {}
+        self.changes = {}
+        self.notes = {}
+        self.iterations = {}
+        self.users = {}
+        self.next_id = 1000
+
+        project = r'/projects/([^/]+)'
+        issue = project + r'/issues/(\d+)'
+        mr = project + r'/merge_requests/(\d+)'
+        self.route('GET', r'/users/(\d+)', self.get_user)
+        self.route('GET', project, self.get_project)
+        self.route('GET', issue, self.get_issue)
+        self.route('PUT', issue, self.update_issue)
+        self.route('GET', issue + r'/resource_iteration_events', self.get_iteration_events)
+        self.route('GET', issue + r'/related_merge_requests', self.get_related_merge_requests)
+        self.route('GET', project + r'/merge_requests', self.list_merge_requests)
+        self.route('POST', project + r'/merge_requests', self.create_merge_request)
+        self.route('GET', mr, self.get_merge_request)
+        self.route('PUT', mr, self.update_merge_request)
+        self.route('GET', mr + r'/changes', self.get_changes)
+        self.route('GET', mr + r'/notes', self.list_notes)
+        self.route('POST', mr + r'/notes', self.create_note)
+        self.route('GET', mr + r'/commits', self.list_commits)
+        self.route('GET', project + r'/repository/branches/(.+)', self.get_branch)
+
+    def _new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    # Setup, used before the service starts receiving requests
+
+    def add_project(self, project_id: int, name: str):
+        self.projects[str(project_id)] = {'id': project_id, 'name': name}
+
+    def add_user(self, user_id: int, username: str):
+        self.users[str(user_id)] = {'id': user_id, 'username': username}
+
+    def add_issue(self, project_id: int, iid: int, labels=(), weight=None, milestone=None,
+                  iteration=None, assignees=()):
+        self.issues[(str(project_id), str(iid))] = {
+            'id': self._new_id(), 'iid': iid, 'project_id': project_id, 'labels': list(labels),
+            'weight': weight, 'milestone': milestone, 'assignees': list(assignees), 'state': 'opened',
+        }
+        self.iterations[(str(project_id), str(iid))] = [{'iteration': iteration}] if iteration else []
+
+    def add_merge_request(self, project_id: int, iid: int, source_branch: str, changes=(), **fields):
+        mr = {
+            'id': self._new_id(), 'iid': iid, 'project_id': project_id, 'source_project_id': project_id,
+            'source_branch': source_branch, 'target_branch': 'dev', 'title': f'Merge request {iid}',
+            'description': '', 'state': 'opened', 'work_in_progress': False, 'labels': [],
+            'milestone': None, 'assignee': None, 'author': {'id': 1, 'username': 'dev'},
+            'merged_by': None, 'sha': f'{iid:040x}', 'created_at': api_date(),
+        }
+        mr.update(fields)
+        self.merge_requests[(str(project_id), str(iid))] = mr
+        self.changes[(str(project_id), str(iid))] = list(changes)
+        self.notes[(str(project_id), str(iid))] = []
+        return mr
+
+    # Routes
+
+    def get_user(self, user_id, query, body):
+        user = self.users.get(user_id)
+        return (200, user) if user else (404, {'message': '404 User Not Found'})
+
+    def get_project(self, project_id, query, body):
+        project = self.projects.get(project_id)
+        return (200, project) if project else (404, {'message': '404 Project Not Found'})
+
+    def get_issue(self, project_id, iid, query, body):
+        issue = self.issues.get((project_id, iid))
+        return (200, issue) if issue else (404, {'message': '404 Issue Not Found'})
+
+    def update_issue(self, project_id, iid, query, body):
+        issue = self.issues.get((project_id, iid))
+        if issue is None:
+            return 404, {'message': '404 Issue Not Found'}
+        if 'labels' in body:
+            issue['labels'] = [label for label in body['labels'].split(',') if label]
+        remove = set(body.get('remove_labels', '').split(','))
+        issue['labels'] = [label for label in issue['labels'] if label not in remove]
+        issue['labels'] += [label for label in body.get('add_labels', '').split(',')
+                            if label and label not in issue['labels']]
+        if body.get('state_event') == 'close':
+            issue['state'] = 'closed'
+        return 200, issue
+
+    def get_iteration_events(self, project_id, iid, query, body):
+        return 200, self.iterations.get((project_id, iid), [])
+
+    def get_related_merge_requests(self, project_id, iid, query, body):
+        return 200, [
+            mr for (mr_project_id, _), mr in self.merge_requests.items()
+            if mr_project_id == project_id and f'_{iid}_' in mr['source_branch']
+        ]
+
+    def list_merge_requests(self, project_id, query, body):
+        return 200, [
+            mr for (mr_project_id, _), mr in self.merge_requests.items()
+            if mr_project_id == project_id
+            and query.get('source_branch') in (None, mr['source_branch'])
+            and query.get('state') in (None, mr['state'])
+        ]
+
+    def create_merge_request(self, project_id, query, body):
+        iid = max([int(iid) for (mr_project_id, iid) in self.merge_requests if mr_project_id == project_id],
+                  default=0) + 1
+        fields = {key: body[key] for key in ('target_branch', 'title', 'description', 'labels') if key in body}
+        return 201, self.add_merge_request(int(project_id), iid, body['source_branch'], **fields)
+
+    def get_merge_request(self, project_id, iid, query, body):
+        mr = self.merge_requests.get((project_id, iid))
+        return (200, mr) if mr else (404, {'message': '404 Not found'})
+
+    def update_merge_request(self, project_id, iid, query, body):
+        mr = self.merge_requests.get((project_id, iid))
+        if mr is None:
+            return 404, {'message': '404 Not found'}
+        mr.update(body)
+        if mr['title'].startswith(('Draft:', 'WIP:')):
+            mr['work_in_progress'] = True
+        return 200, mr
+
+    def get_changes(self, project_id, iid, query, body):
+        mr = self.merge_requests.get((project_id, iid))
+        if mr is None:
+            return 404, {'message': '404 Not found'}
+        return 200, dict(mr, changes=self.changes[(project_id, iid)])
+
+    def list_notes(self, project_id, iid, query, body):
+        notes = self.notes.get((project_id, iid), [])
+        return 200, sorted(notes, key=lambda note: note['id'], reverse=query.get('sort') != 'asc')
+
+    def create_note(self, project_id, iid, query, body):
+        note = {
+            'id': self._new_id(), 'body': body['body'], 'system': False,
+            'author': {'username': self.bot_username}, 'created_at': api_date(),
+        }
+        self.notes.setdefault((project_id, iid), []).append(note)
+        return 201, note
+
+    def list_commits(self, project_id, iid, query, body):
+        mr = self.merge_requests.get((project_id, iid))
+        if mr is None:
+            return 404, {'message': '404 Not found'}
+        return 200, [{'id': mr['sha'], 'created_at': mr['created_at']}]
+
+    def get_branch(self, project_id, branch_name, query, body):
+        return 200, {'name': branch_name, 'commit': {'id': '0' * 40, 'created_at': api_date()}}
+
+
+class FakeSlack(FakeService):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.messages = []
+        self.route('POST', r'/chat.postMessage', self.post_message)
+        self.route('GET', r'/users.list', self.list_users)
+
+    def post_message(self, query, body):
+        self.messages.append(query)
+        return 200, {'ok': True}
+
+    def list_users(self, query, body):
+        return 200, {'ok': True, 'members': []}
@@ -0,0 +1,67 @@
+"""Measure the cold import time of the gorrabot entry points.
+
+Each module is imported in a fresh interpreter with ``-X importtime`` and
+the median of the runs is reported, along with the slowest modules of the
+last run. Importing must not need the environment nor reach Vault, so
+this runs without any secret.
+
+Usage: python benchmarks/import_time.py [--runs N] [--top N] [--max-ms MS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# app.py bootstraps when imported, so the web process is measured through
+# the modules it imports
+ENTRY_POINTS = [
+    'gorrabot.server',
+    'gorrabot.event_handling',
+    'gorrabot.comment_stale_merge_requests',
+    'gorrabot.slack_resume',
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str):
+    """Return {imported module: cumulative microseconds} of a cold import"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        universal_newlines=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, help='exit with an error if some entry point is slower')
+    args = parser.parse_args()
+
+    too_slow = False
+    for module in ENTRY_POINTS:
+        runs = [import_times(module) for _ in range(args.runs)]
+        total_ms = statistics.median(run[module] for run in runs) / 1000
+        print(f"{module}: {total_ms:.1f} ms")
+        slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+        for name, cumulative in [item for item in slowest if item[0] != module][:args.top]:
+            print(f"    {name}: {cumulative / 1000:.1f} ms")
+        if args.max_ms is not None and total_ms > args.max_ms:
+            too_slow = True
+    if too_slow:
+        print(f"Some entry point takes more than {args.max_ms} ms to import")
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Replay webhooks recorded with GORRABOT_RECORD_DIR, to load test with the
+real mix of events.
+
+Events are sent either to event_handling.handle_event in this process,
+through a ShardedBuffer like the web process does, or to the /webhook
+endpoint of a running gorrabot. They are sent at the recorded pace
+divided by --speed, or as fast as possible with --speed 0. Throughput and
+latency are reported per event kind. In handler mode latency is the
+handling time, in HTTP mode it's the time to accept the webhook.
+
+Handler mode acts on the GitLab and Slack the environment points to. Set
+GITLAB_API_URL and SLACK_API_URL to fakes or to a staging instance.
+
+Usage: python benchmarks/replay_webhooks.py ARCHIVE_OR_DIR [...]
+           [--url http://host/webhook] [--speed X] [--limit N] [--workers N]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gorrabot.recorder import archive_files, read_archive  # noqa: E402
+from webhook_throughput import percentile  # noqa: E402
+
+
+def read_records(paths, limit: int = None):
+    count = 0
+    for path in paths:
+        files = archive_files(path) if os.path.isdir(path) else [path]
+        for file_path in files:
+            for record in read_archive(file_path):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield record
+
+
+def kind_of(event: dict) -> str:
+    kind = event.get('object_kind', 'unknown')
+    if kind == 'merge_request':
+        kind += ':' + str(event.get('object_attributes', {}).get('action', 'unknown'))
+    return kind
+
+
+class Results:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, kind: str, latency: float, ok: bool):
+        with self._lock:
+            self.latencies[kind].append(latency)
+            if not ok:
+                self.errors[kind] += 1
+
+    def print(self, elapsed: float):
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        print(f"{total} events in {elapsed:.1f}s, {total / elapsed:.1f} events/s")
+        print(f"{'kind':<32}{'events':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>10}")
+        for kind, latencies in sorted(self.latencies.items()):
+            print(f"{kind:<32}{len(latencies):>10}{percentile(latencies, 0.5) * 1000:>10.1f}"
+                  f"{percentile(latencies, 0.99) * 1000:>10.1f}{max(latencies) * 1000:>10.1f}"
+                  f"{self.errors[kind]:>10}")
+
+
+def handler_sender(results: Results, workers: int):
+    """Send to handle_event in this process. Returns (send, wait)"""
+    from gorrabot.bootstrap import bootstrap
+    from gorrabot.event_handling import handle_event
+    from gorrabot.worker_factory import ShardedBuffer, start_workers
+    bootstrap()
+
+    def timed_handle_event(event):
+        start = time.monotonic()
+        ok = True
+        try:
+            handle_event(event)
+        except Exception:
+            ok = False
+        results.add(kind_of(event), time.monotonic() - start, ok)
+
+    buffer = ShardedBuffer(workers)
+    start_workers(buffer, timed_handle_event)
+
+    def wait():
+        for queue in buffer.queues:
+            queue.join()
+    return lambda record: buffer.put(record['event']), wait
+
+
+def http_sender(results: Results, url: str, workers: int):
+    """POST to a /webhook endpoint. Returns (send, wait)"""
+    import requests
+    session = requests.Session()
+    token = os.environ.get('GITLAB_CHECK_TOKEN', '')
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def post(record):
+        headers = dict(record['headers'], **{'X-Gitlab-Token': token})
+        # A new delivery id, or gorrabot would drop the event as a retry
+        headers['X-Gitlab-Event-UUID'] = str(uuid.uuid4())
+        start = time.monotonic()
+        try:
+            ok = session.post(url, json=record['event'], headers=headers, timeout=30).ok
+        except requests.RequestException:
+            ok = False
+        results.add(kind_of(record['event']), time.monotonic() - start, ok)
+
+    def wait():
+        executor.shutdown(wait=True)
+    return lambda record: executor.submit(post, record), wait
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('archives', nargs='+', help='archive files or directories with archives')
+    parser.add_argument('--url', help='webhook endpoint to send the events to, instead of handle_event')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='speed up factor of the recorded pace, 0 sends as fast as possible')
+    parser.add_argument('--limit', type=int, help='replay at most this number of events')
+    parser.add_argument('--workers', type=int, default=4, help='event workers, or concurrent requests with --url')
+    args = parser.parse_args()
+
+    results = Results()
+    if args.url:
+        send, wait = http_sender(results, args.url, args.workers)
+    else:
+        send, wait = handler_sender(results, args.workers)
+
+    start = time.monotonic()
+    first_received_at = None
+    for record in read_records(args.archives, args.limit):
+        if args.speed > 0:
+            if first_received_at is None:
+                first_received_at = record['received_at']
+            delay = start + (record['received_at'] - first_received_at) / args.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        send(record)
+    wait()
+    elapsed = time.monotonic() - start
+    if not results.latencies:
+        print("No events to replay")
+        return
+    results.print(elapsed)
+
+
+if __name__ == '__main__':
+    main()
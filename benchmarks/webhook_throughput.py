@@ -0,0 +1,270 @@
+"""Throughput of the webhook pipeline against local GitLab and Slack fakes.
+
+Each scenario builds its fixtures in the fakes, queues its events in a
+ShardedBuffer handled by event_handling.handle_event, as the web process
+does, and reports events per second, p50/p99 handling latency and the API
+calls made per event. Nothing leaves the machine.
+
+Usage: python benchmarks/webhook_throughput.py [--events N] [--workers N]
+           [--latency MS] [--jitter MS] [--scenario NAME ...]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeGitlab, FakeSlack  # noqa: E402
+
+BOT_USERNAME = 'gorrabot'
+PROJECT_ID = 1
+PROJECT_NAME = 'bench'
+MULTI_PROJECT_ID = 2
+MULTI_PROJECT_NAME = 'bench-multi'
+MAIN_BRANCHES = ['white', 'pink', 'black']
+
+CONFIG = f"""
+gitlab:
+  BACKLOG_MILESTONE: [Backlog]
+projects:
+  {PROJECT_NAME}:
+    id: {PROJECT_ID}
+  {MULTI_PROJECT_NAME}:
+    id: {MULTI_PROJECT_ID}
+    regex: '^(?:tkt|mig|sup|exp)_(?P<base>{'|'.join(MAIN_BRANCHES)})_(?P<iid>\\d+)[-_].+'
+    multi-branch: [{', '.join(MAIN_BRANCHES)}]
+"""
+
+MILESTONE = {'id': 7, 'title': 'Sprint', 'state': 'active'}
+ITERATION = {'id': 3, 'title': 'Iteration 3'}
+
+
+def changelog(path: str, text: str):
+    return {'new_path': path, 'diff': f'@@ -0,0 +1 @@\n+{text}\n'}
+
+
+def push_event(project_id: int, project_name: str, branch: str) -> dict:
+    return {
+        'object_kind': 'push',
+        'ref': f'refs/heads/{branch}',
+        'checkout_sha': 'a' * 40,
+        'project_id': project_id,
+        'user_username': 'dev',
+        'user': {'username': 'dev'},
+        'repository': {'name': project_name},
+    }
+
+
+def mr_event(mr: dict, project_name: str) -> dict:
+    attributes = {
+        key: mr[key] for key in (
+            'iid', 'source_project_id', 'source_branch', 'target_branch', 'title', 'description', 'state',
+            'work_in_progress',
+        )
+    }
+    attributes.update({
+        'author_id': 1, 'assignee_id': None, 'milestone_id': None,
+        'updated_at': time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime()),
+    })
+    return {
+        'object_kind': 'merge_request',
+        'user': {'username': 'dev'},
+        'project': {'id': mr['project_id']},
+        'repository': {'name': project_name},
+        'object_attributes': attributes,
+        'assignee': {'username': 'dev'},
+        'labels': [],
+    }
+
+
+# Scenarios get the fake GitLab and the iids they must use, set up their
+# fixtures and return the events
+
+def push_scenario(gitlab: FakeGitlab, iids):
+    """Push to a ticket branch whose issue lacks some required fields"""
+    events = []
+    for iid in iids:
+        gitlab.add_issue(PROJECT_ID, iid, labels=['priority::high'], milestone=MILESTONE)
+        events.append(push_event(PROJECT_ID, PROJECT_NAME, f'tkt_{iid}_feature'))
+    return events
+
+
+def multi_branch_push_scenario(gitlab: FakeGitlab, iids):
+    """First push to the pink branch of a ticket that has a white MR, which
+    creates the upper MR"""
+    events = []
+    for iid in iids:
+        gitlab.add_issue(MULTI_PROJECT_ID, iid, labels=['priority::high', 'severity::low'], weight=1,
+                         milestone=MILESTONE, iteration=ITERATION)
+        gitlab.add_merge_request(MULTI_PROJECT_ID, iid, f'tkt_white_{iid}_feature',
+                                 changes=[changelog(f'CHANGELOG/current/{iid}.md', f'[ADD] Feature #{iid}')])
+        events.append(push_event(MULTI_PROJECT_ID, MULTI_PROJECT_NAME, f'tkt_pink_{iid}_feature'))
+    return events
+
+
+def _mr_scenario(gitlab: FakeGitlab, iids, changes_for):
+    events = []
+    for iid in iids:
+        gitlab.add_issue(PROJECT_ID, iid, labels=['stage::Accepted'], milestone=MILESTONE)
+        mr = gitlab.add_merge_request(PROJECT_ID, iid, f'tkt_{iid}_feature', changes=changes_for(iid))
+        events.append(mr_event(mr, PROJECT_NAME))
+    return events
+
+
+def mr_valid_changelog_scenario(gitlab: FakeGitlab, iids):
+    """MR update with a well formed changelog"""
+    return _mr_scenario(gitlab, iids, lambda iid: [
+        changelog(f'CHANGELOG/current/{iid}.md', f'[ADD] Feature #{iid}'),
+        {'new_path': 'gorrabot/feature.py', 'diff': '@@ -1 +1 @@\n-a\n+b\n'},
+    ])
+
+
+def mr_bad_changelog_scenario(gitlab: FakeGitlab, iids):
+    """MR update whose changelog has no prefix nor issue reference"""
+    return _mr_scenario(gitlab, iids, lambda iid: [changelog(f'CHANGELOG/current/{iid}.md', 'Feature')])
+
+
+def mr_wrong_filetype_scenario(gitlab: FakeGitlab, iids):
+    """MR update whose changelog has the wrong extension"""
+    return _mr_scenario(gitlab, iids, lambda iid: [changelog(f'CHANGELOG/current/{iid}.txt', f'[ADD] #{iid}')])
+
+
+def mr_missing_changelog_scenario(gitlab: FakeGitlab, iids):
+    """MR update without changelog, which is commented and set as draft"""
+    return _mr_scenario(gitlab, iids, lambda iid: [
+        {'new_path': 'gorrabot/feature.py', 'diff': '@@ -1 +1 @@\n-a\n+b\n'},
+    ])
+
+
+def multi_branch_merge_scenario(gitlab: FakeGitlab, iids):
+    """Merge of the white MR of a ticket whose pink MR is still open"""
+    events = []
+    for iid in iids:
+        gitlab.add_issue(MULTI_PROJECT_ID, iid, labels=['stage::Test'], milestone=MILESTONE)
+        changes = [changelog(f'CHANGELOG/current/{iid}.md', f'[FIX] Bug #{iid}')]
+        mr = gitlab.add_merge_request(MULTI_PROJECT_ID, iid, f'tkt_white_{iid}_bug', changes=changes,
+                                      state='merged', merged_by={'username': 'dev'})
+        gitlab.add_merge_request(MULTI_PROJECT_ID, iid + 1, f'tkt_pink_{iid}_bug', changes=changes)
+        events.append(mr_event(mr, MULTI_PROJECT_NAME))
+    return events
+
+
+SCENARIOS = {
+    'push': push_scenario,
+    'push-multi-branch': multi_branch_push_scenario,
+    'mr-changelog-valid': mr_valid_changelog_scenario,
+    'mr-changelog-bad-format': mr_bad_changelog_scenario,
+    'mr-changelog-wrong-filetype': mr_wrong_filetype_scenario,
+    'mr-changelog-missing': mr_missing_changelog_scenario,
+    'mr-merge-multi-branch': multi_branch_merge_scenario,
+}
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_scenario(name: str, gitlab: FakeGitlab, slack: FakeSlack, first_iid: int, args) -> dict:
+    from gorrabot.api.slack.messages import outbox
+    from gorrabot.event_handling import handle_event
+    from gorrabot.worker_factory import ShardedBuffer, start_workers
+
+    # Multi-branch scenarios use two MR iids per ticket
+    events = SCENARIOS[name](gitlab, range(first_iid, first_iid + 2 * args.events, 2))
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def timed_handle_event(event):
+        start = time.monotonic()
+        try:
+            handle_event(event)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+        with lock:
+            latencies.append(time.monotonic() - start)
+
+    buffer = ShardedBuffer(args.workers)
+    start_workers(buffer, timed_handle_event)
+    gitlab_calls, slack_calls = gitlab.calls, slack.calls
+    start = time.monotonic()
+    for event in events:
+        buffer.put(event)
+    for queue in buffer.queues:
+        queue.join()
+    elapsed = time.monotonic() - start
+    # Error channel messages are sent in background, they are counted but
+    # not timed
+    outbox.flush(timeout=60)
+    if errors:
+        print(f"{name}: {len(errors)} events failed, first error: {errors[0]!r}", file=sys.stderr)
+    return {
+        'events/s': len(events) / elapsed,
+        'p50 ms': percentile(latencies, 0.5) * 1000,
+        'p99 ms': percentile(latencies, 0.99) * 1000,
+        'gitlab/event': (gitlab.calls - gitlab_calls) / len(events),
+        'slack/event': (slack.calls - slack_calls) / len(events),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=50, help='events of each scenario')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=20, help='milliseconds added to every API response')
+    parser.add_argument('--jitter', type=float, default=10, help='random milliseconds added on top of latency')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, can be repeated. All by default')
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+
+    gitlab = FakeGitlab(BOT_USERNAME, latency=args.latency / 1000, jitter=args.jitter / 1000)
+    gitlab.add_project(PROJECT_ID, PROJECT_NAME)
+    gitlab.add_project(MULTI_PROJECT_ID, MULTI_PROJECT_NAME)
+    gitlab.add_user(1, 'dev')
+    slack = FakeSlack(latency=args.latency / 1000, jitter=args.jitter / 1000)
+
+    workdir = tempfile.mkdtemp(prefix='gorrabot-bench-')
+    config_path = os.path.join(workdir, 'config.yaml')
+    with open(config_path, 'w') as config_file:
+        config_file.write(CONFIG)
+    # Must be set before gorrabot is imported
+    os.environ.update({
+        'GITLAB_API_URL': gitlab.start(),
+        'SLACK_API_URL': slack.start(),
+        'GITLAB_TOKEN': 'bench',
+        'GITLAB_CHECK_TOKEN': 'bench',
+        'GITLAB_BOT_USERNAME': BOT_USERNAME,
+        'SLACK_BOT_TOKEN': 'bench',
+        'SKIP_VAULT': '1',
+        'NOTIFY_DEFAULT_CHANNEL': 'bench-errors',
+        'GORRABOT_CONFIG_FILE': config_path,
+        'GORRABOT_CACHE_DIR': workdir,
+    })
+    for name in ('GORRABOT_DEBUG', 'NOTIFY_DEBUG_CHANNEL', 'GORRABOT_QUEUE_PATH', 'DEBUG'):
+        os.environ.pop(name, None)
+    from gorrabot.bootstrap import bootstrap
+    bootstrap()
+
+    columns = ['events/s', 'p50 ms', 'p99 ms', 'gitlab/event', 'slack/event', 'errors']
+    print(f"{args.events} events per scenario, {args.workers} workers, "
+          f"{args.latency:g}+{args.jitter:g} ms of API latency")
+    print(f"{'scenario':<28}" + ''.join(f'{column:>14}' for column in columns))
+    for i, name in enumerate(args.scenario or SCENARIOS):
+        result = run_scenario(name, gitlab, slack, first_iid=1 + i * 10 * max(args.events, 1), args=args)
+        print(f"{name:<28}" + ''.join(f'{result[column]:>14.1f}' for column in columns))
+    gitlab.stop()
+    slack.stop()
+
+
+if __name__ == '__main__':
+    main()
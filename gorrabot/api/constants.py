@@ -1,15 +1,9 @@
-from gorrabot.config import config
-
-gitlab_to_slack_user_dict = config()['gitlab'].get('gitlab_to_slack_user_dict', None)
-slack_to_gitlab_user_dict = {value: key for key, value in gitlab_to_slack_user_dict.items()}
+from gorrabot.config import compiled_config
 
 
 def gitlab_to_slack_user(user: str):
-    return gitlab_to_slack_user_dict[user] if user in gitlab_to_slack_user_dict else None
+    return compiled_config().gitlab.gitlab_to_slack_user_dict.get(user)
 
 
 def slack_to_gitlab_user(user: str):
-    return slack_to_gitlab_user_dict[user] if user in slack_to_gitlab_user_dict else None
-
-
-MAX_ISSUES_ACCEPTED = int(config()['gitlab'].get('MAX_ISSUES_ACCEPTED', 2))
+    return compiled_config().gitlab.slack_to_gitlab_user_dict.get(user)
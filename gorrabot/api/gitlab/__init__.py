@@ -1,22 +1,49 @@
 import os
 import requests
 
-from gorrabot.config import config
+from gorrabot.api.gitlab.http_cache import ETagCache
+from gorrabot.api.gitlab.session import GitlabSession
+from gorrabot.config import compiled_config
+from gorrabot.metrics import instrument_session
 
-GITLAB_TOKEN = os.environ['GITLAB_TOKEN']
-GITLAB_REQUEST_TOKEN = os.environ['GITLAB_CHECK_TOKEN']
-GITLAB_SELF_USERNAME = os.environ['GITLAB_BOT_USERNAME']
 
-GITLAB_API_PREFIX = 'https://gitlab.com/api/v4'
+# The environment is read when it's needed, so importing this module
+# doesn't require it
+def gitlab_api_prefix() -> str:
+    return os.environ.get('GITLAB_API_URL', 'https://gitlab.com/api/v4')
 
-gitlab_session = requests.Session()
-gitlab_session.headers['Private-Token'] = GITLAB_TOKEN
 
+def gitlab_token() -> str:
+    return os.environ['GITLAB_TOKEN']
 
-class GitlabLabels:
-    DONT_RUSH_ME = config()['gitlab']['labels'].get('DONT_RUSH_ME', 'Do not rush me')
-    NO_CHANGELOG = config()['gitlab']['labels'].get('NO_CHANGELOG', 'No changelog')
-    DONT_TRACK = config()['gitlab']['labels'].get('DONT_TRACK', 'Do not track')
-    MULTIPLE_MR = config()['gitlab']['labels'].get('MULTIPLE_MR', 'Multiple MR')
-    TEST = config()['gitlab']['labels'].get('TEST', 'Test')
-    ACCEPTED = config()['gitlab']['labels'].get('ACCEPTED', 'Accepted')
+
+def gitlab_request_token() -> str:
+    return os.environ['GITLAB_CHECK_TOKEN']
+
+
+def gitlab_self_username() -> str:
+    return os.environ['GITLAB_BOT_USERNAME']
+
+
+class PrivateTokenAuth(requests.auth.AuthBase):
+    def __call__(self, request):
+        request.headers['Private-Token'] = gitlab_token()
+        return request
+
+
+gitlab_session = GitlabSession(etag_cache=ETagCache(gitlab_api_prefix))
+gitlab_session.auth = PrivateTokenAuth()
+instrument_session(gitlab_session, 'gitlab')
+
+
+class _ConfiguredLabels(type):
+    def __getattr__(cls, name):
+        try:
+            return compiled_config().gitlab.labels[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class GitlabLabels(metaclass=_ConfiguredLabels):
+    """Label names, read from the current config on every access:
+    DONT_RUSH_ME, NO_CHANGELOG, DONT_TRACK, MULTIPLE_MR, TEST and ACCEPTED"""
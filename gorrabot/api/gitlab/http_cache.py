@@ -0,0 +1,108 @@
+"""Conditional GET cache of GitLab responses.
+
+Responses of the endpoints in CONDITIONAL_GET_PATHS are kept with their
+ETag, and requested again with If-None-Match. When GitLab answers 304 Not
+Modified, the kept body is used, which is much cheaper for both sides
+than downloading it again. Entries are evicted least recently used first
+when there are too many or they take too much memory.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import requests
+
+# Paths, after the API prefix, whose GET responses are cached. The issue
+# and MR lists aren't: only the cron jobs read them, never the same page
+# twice, so they would only fill the cache
+CONDITIONAL_GET_PATHS = [re.compile(pattern + '$') for pattern in (
+    r'/projects/[^/]+',
+    r'/projects/[^/]+/issues/\d+',
+    r'/projects/[^/]+/issues/\d+/(resource_iteration_events|related_merge_requests)',
+    r'/projects/[^/]+/merge_requests/\d+',
+    r'/projects/[^/]+/merge_requests/\d+/(changes|notes|commits)',
+    r'/projects/[^/]+/repository/branches/[^/]+',
+    r'/users/\d+',
+)]
+
+MAX_ENTRIES = 2000
+MAX_BYTES = 50 * 1024 * 1024
+
+
+class CachedResponse:
+    __slots__ = ('etag', 'content', 'headers', 'encoding')
+
+    def __init__(self, res: requests.Response):
+        self.etag = res.headers['ETag']
+        self.content = res.content
+        self.headers = dict(res.headers)
+        self.encoding = res.encoding
+
+    def to_response(self, not_modified: requests.Response) -> requests.Response:
+        """Rebuild the full response from the 304 that validated it"""
+        res = requests.Response()
+        res.status_code = 200
+        res._content = self.content
+        res.headers = requests.structures.CaseInsensitiveDict(self.headers)
+        # Fresh headers, like the rate limit ones, come from the 304
+        res.headers.update(not_modified.headers)
+        res.encoding = self.encoding
+        res.url = not_modified.url
+        res.request = not_modified.request
+        res.elapsed = not_modified.elapsed
+        res.reason = 'OK'
+        return res
+
+
+class ETagCache:
+
+    def __init__(self, api_prefix: Callable[[], str], max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        # Called on each request, so the API URL is read when it's needed
+        self.api_prefix = api_prefix
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def is_cacheable(self, request: requests.PreparedRequest) -> bool:
+        if request.method != 'GET':
+            return False
+        path = requests.utils.urlparse(request.url).path
+        path_prefix = requests.utils.urlparse(self.api_prefix()).path
+        if not path.startswith(path_prefix):
+            return False
+        path = path[len(path_prefix):]
+        return any(pattern.match(path) for pattern in CONDITIONAL_GET_PATHS)
+
+    def get(self, url: str) -> CachedResponse:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def set(self, url: str, res: requests.Response):
+        entry = CachedResponse(res)
+        with self._lock:
+            self._discard(url)
+            if len(entry.content) > self.max_bytes:
+                return
+            self._entries[url] = entry
+            self._bytes += len(entry.content)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, url: str):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._bytes -= len(entry.content)
+
+    def discard(self, url: str):
+        with self._lock:
+            self._discard(url)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
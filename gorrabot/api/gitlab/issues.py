@@ -1,22 +1,41 @@
-from gorrabot.api.gitlab import gitlab_session, GITLAB_API_PREFIX
-from gorrabot.api.gitlab.utils import paginated_get
+import logging
+
+from gorrabot.api.gitlab import gitlab_session, gitlab_api_prefix
+from gorrabot.api.gitlab.request_cache import (
+    cached,
+    cached_get,
+    invalidate,
+    pending_write,
+    pop_deferred_writes,
+    store,
+)
+from gorrabot.api.gitlab.utils import iter_paginated, paginated_get, PREFETCH_WORKERS
+
+logger = logging.getLogger(__name__)
 
 
 def get_issue(project_id: int, iid: int):
-    url = '{}/projects/{}/issues/{}'.format(
-            GITLAB_API_PREFIX, project_id, iid)
-    res = gitlab_session.get(url)
-    if res.status_code == 404:
-        return
-    res.raise_for_status()
-    return res.json()
+    def fetch():
+        url = '{}/projects/{}/issues/{}'.format(
+                gitlab_api_prefix(), project_id, iid)
+        res = gitlab_session.get(url)
+        if res.status_code == 404:
+            return
+        res.raise_for_status()
+        return res.json()
+    return cached_get(('issue', project_id, iid), fetch)
 
 
 def get_issues(project_id: int, filters: dict = None):
     if filters is None:
         filters = {}
-    url = f'{GITLAB_API_PREFIX}/projects/{project_id}/issues'
-    return paginated_get(url, filters)
+    url = f'{gitlab_api_prefix()}/projects/{project_id}/issues'
+    return paginated_get(url, filters, PREFETCH_WORKERS)
+
+
+def iter_issues(project_id: int, filters: dict = None):
+    url = f'{gitlab_api_prefix()}/projects/{project_id}/issues'
+    return iter_paginated(url, filters, PREFETCH_WORKERS)
 
 
 def get_accepted_issues(project_id: int):
@@ -26,12 +45,69 @@ def get_accepted_issues(project_id: int):
         'state': 'opened',
         'per_page': 100,
     }
-    return get_issues(project_id, filters)
+    return iter_issues(project_id, filters)
+
 
+def update_issue_labels(project_id: int, iid: int, add=(), remove=(), state_event: str = None):
+    """Add and remove labels without reading the issue, so concurrent
+    changes to other labels aren't overwritten.
 
-def update_issue(project_id: int, iid: int, data: dict):
+    While an event is handled, the changes to the issue are merged and
+    flush_issue_updates sends them in a single request at the end.
+    """
+    add, remove = set(add), set(remove) - set(add)
+    pending = pending_write(('issue', project_id, iid))
+    if pending is None:
+        return put_issue_changes(project_id, iid, add, remove, state_event)
+    pending_add = pending.setdefault('add_labels', set())
+    pending_remove = pending.setdefault('remove_labels', set())
+    pending_add.difference_update(remove)
+    pending_add.update(add)
+    pending_remove.difference_update(add)
+    pending_remove.update(remove)
+    if state_event is not None:
+        pending['state_event'] = state_event
+
+    issue = cached(('issue', project_id, iid))
+    if issue is not None:
+        # Later reads during the event must see the pending changes
+        labels = [label for label in issue['labels'] if label not in remove]
+        labels.extend(sorted(add - set(labels)))
+        store(('issue', project_id, iid), dict(issue, labels=labels))
+
+
+def flush_issue_updates():
+    """Send the deferred issue updates of the current event. A failed
+    update is logged and doesn't stop the others. The session already
+    retries the PUT on transient errors, it's idempotent"""
+    for (_, project_id, iid), pending in pop_deferred_writes('issue'):
+        try:
+            put_issue_changes(
+                project_id, iid, pending.get('add_labels', ()), pending.get('remove_labels', ()),
+                pending.get('state_event')
+            )
+        except Exception:
+            logger.exception(f"Error updating issue {iid} of project {project_id} with {pending}")
+
+
+def put_issue_changes(project_id: int, iid: int, add, remove, state_event: str = None):
+    data = {}
+    if add:
+        data['add_labels'] = ','.join(sorted(add))
+    if remove:
+        data['remove_labels'] = ','.join(sorted(remove))
+    if state_event is not None:
+        data['state_event'] = state_event
+    if not data:
+        return
     url = '{}/projects/{}/issues/{}'.format(
-            GITLAB_API_PREFIX, project_id, iid)
+            gitlab_api_prefix(), project_id, iid)
+    invalidate('issue', project_id, iid)
     res = gitlab_session.put(url, json=data)
+    if res.status_code == 404:
+        logger.info(f"Not updating issue {iid} of project {project_id}, it doesn't exist")
+        return
     res.raise_for_status()
-    return res.json()
+    issue = res.json()
+    store(('issue', project_id, iid), issue)
+    return issue
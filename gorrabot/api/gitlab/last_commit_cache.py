@@ -0,0 +1,70 @@
+"""On-disk cache of the last commit date of merge requests.
+
+A merge request's last commit is the one its head ``sha`` points to, and
+commits never change, so the date can be reused by every later run until
+the MR gets new commits.
+"""
+import json
+import logging
+import os
+import threading
+
+from gorrabot.config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Number of commits remembered, the oldest ones are forgotten first
+MAX_ENTRIES = 5000
+
+
+class LastCommitCache:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dates = None
+        self._dirty = False
+
+    def _load(self):
+        # Read on first use, so importing this module doesn't touch the disk
+        if self._dates is not None:
+            return
+        self._dates = {}
+        try:
+            with open(self.path) as stream:
+                self._dates = json.load(stream)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable last commit cache {self.path}: {e}")
+
+    def get(self, sha: str):
+        with self._lock:
+            self._load()
+            return self._dates.get(sha)
+
+    def set(self, sha: str, created_at: str):
+        with self._lock:
+            self._load()
+            self._dates.pop(sha, None)
+            self._dates[sha] = created_at
+            while len(self._dates) > MAX_ENTRIES:
+                del self._dates[next(iter(self._dates))]
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w') as stream:
+                    json.dump(self._dates, stream)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                logger.warning(f"Could not save last commit cache {self.path}: {e}")
+
+
+last_commit_cache = LastCommitCache(os.path.join(CACHE_DIR, 'last_commits.json'))
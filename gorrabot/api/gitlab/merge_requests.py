@@ -1,45 +1,79 @@
 import datetime
 import logging
 
-from gorrabot.api.gitlab import gitlab_session, GITLAB_API_PREFIX
+from gorrabot.api.gitlab import gitlab_session, gitlab_api_prefix
+from gorrabot.api.gitlab.notes_index import notes_index
 from gorrabot.api.gitlab.projects import get_project_name
-from gorrabot.api.gitlab.utils import paginated_get
-from gorrabot.api.utils import parse_api_date
-from gorrabot.config import config
+from gorrabot.api.gitlab.request_cache import (
+    cached,
+    cached_get,
+    defer_write,
+    invalidate,
+    pending_changes,
+    pop_deferred_writes,
+    store,
+)
+from gorrabot.api.gitlab.utils import iter_paginated, paginated_get, PREFETCH_WORKERS
+from gorrabot.api.utils import parse_webhook_date
+from gorrabot.config import compiled_config
 
 logger = logging.getLogger(__name__)
 
+# Webhooks older than this number of seconds, e.g. replayed after a
+# restart, aren't trusted to tell if the MR is a draft
+MAX_WEBHOOK_STATE_AGE = 5 * 60
+
 
 def get_merge_requests(project_id: int, filters=None):
     if filters is None:
         filters = {}
-    url = f'{GITLAB_API_PREFIX}/projects/{project_id}/merge_requests'
-    return paginated_get(url, filters)
+    url = f'{gitlab_api_prefix()}/projects/{project_id}/merge_requests'
+    return paginated_get(url, filters, PREFETCH_WORKERS)
+
+
+def iter_merge_requests(project_id: int, filters: dict = None):
+    url = f'{gitlab_api_prefix()}/projects/{project_id}/merge_requests'
+    return iter_paginated(url, filters, PREFETCH_WORKERS)
 
 
 def mr_url(project_id, iid):
     return '{}/projects/{}/merge_requests/{}'.format(
-            GITLAB_API_PREFIX, project_id, iid)
+            gitlab_api_prefix(), project_id, iid)
 
 
 def get_mr_changes(project_id: int, iid: int):
-    url = mr_url(project_id, iid) + '/changes'
-    res = gitlab_session.get(url)
-    res.raise_for_status()
-    return res.json()['changes']
+    def fetch():
+        url = mr_url(project_id, iid) + '/changes'
+        res = gitlab_session.get(url)
+        res.raise_for_status()
+        return res.json()['changes']
+    return cached_get(('merge_request_changes', project_id, iid), fetch)
 
 
 def get_mr(project_id: int, iid: int):
-    url = f'{GITLAB_API_PREFIX}/projects/{project_id}/merge_requests/{iid}'
-    res = gitlab_session.get(url)
-    res.raise_for_status()
-    return res.json()
+    """The MR, with the changes deferred by update_mr during this event"""
+    def fetch():
+        url = f'{gitlab_api_prefix()}/projects/{project_id}/merge_requests/{iid}'
+        res = gitlab_session.get(url)
+        res.raise_for_status()
+        # The MR may be updated before it's read for the first time
+        changes = pending_changes(('merge_request', project_id, iid))
+        return _with_changes(res.json(), changes) if changes else res.json()
+    return cached_get(('merge_request', project_id, iid), fetch)
+
+
+def _with_changes(mr: dict, data: dict) -> dict:
+    mr = dict(mr, **data)
+    if mr['title'].startswith(('Draft:', 'WIP:')):
+        mr['work_in_progress'] = True
+    return mr
 
 
 def get_mr_last_commit(mr: dict):
     project_id = mr['source_project_id']
     url = mr_url(project_id, mr['iid']) + '/commits'
-    res = gitlab_session.get(url)
+    # Commits are sorted from newest to oldest, only the first one is needed
+    res = gitlab_session.get(url, params={'per_page': 1})
     res.raise_for_status()
     try:
         return res.json()[0]
@@ -49,7 +83,7 @@ def get_mr_last_commit(mr: dict):
 
 def create_mr(project_id: int, mr_data: dict):
     url = (
-        f"{GITLAB_API_PREFIX}/projects/{project_id}/"
+        f"{gitlab_api_prefix()}/projects/{project_id}/"
         f"merge_requests"
     )
     res = gitlab_session.post(url, json=mr_data)
@@ -57,11 +91,23 @@ def create_mr(project_id: int, mr_data: dict):
     return res.json()
 
 
-def set_wip(project_id: int, iid: int):
-    url = mr_url(project_id, iid)
-    res = gitlab_session.get(url)
-    res.raise_for_status()
-    mr = res.json()
+def webhook_draft_state(mr_attributes: dict):
+    """Title and draft state of the MR according to the object_attributes
+    of its webhook, or None if they are missing or too old"""
+    try:
+        state = {key: mr_attributes[key] for key in ('title', 'work_in_progress')}
+        updated_at = parse_webhook_date(mr_attributes['updated_at'])
+    except (KeyError, ValueError):
+        return None
+    if (datetime.datetime.utcnow() - updated_at).total_seconds() > MAX_WEBHOOK_STATE_AGE:
+        return None
+    return state
+
+
+def set_wip(project_id: int, iid: int, webhook_state: dict = None):
+    """Mark the MR as draft. webhook_state, from webhook_draft_state, is
+    used to decide when the MR wasn't read during this event"""
+    mr = cached(('merge_request', project_id, iid)) or webhook_state or get_mr(project_id, iid)
 
     if not mr['work_in_progress'] and not mr['title'].startswith('WIP:') and not mr['title'].startswith('Draft:'):
         data = {"title": "Draft: " + mr['title']}
@@ -71,55 +117,73 @@ def set_wip(project_id: int, iid: int):
 
 
 def update_mr(project_id: int, iid: int, data: dict):
+    """Update the MR. While an event is handled the change is deferred
+    and merged with the other changes to the MR, flush_mr_updates sends
+    them in a single request at the end.
+
+    Returns the MR as it will be after the update, if it's known.
+    """
+    if not defer_write(('merge_request', project_id, iid), data):
+        return put_mr(project_id, iid, data)
+    mr = cached(('merge_request', project_id, iid))
+    if mr is None:
+        return None
+    # Later reads during the event must see the pending changes, get_mr
+    # applies them when the MR isn't cached yet
+    mr = _with_changes(mr, data)
+    store(('merge_request', project_id, iid), mr)
+    return mr
+
+
+def flush_mr_updates():
+    """Send the deferred MR updates of the current event. A failed update
+    is logged and doesn't stop the others. The session already retries the
+    PUT on transient errors, it's idempotent"""
+    for (_, project_id, iid), data in pop_deferred_writes('merge_request'):
+        try:
+            put_mr(project_id, iid, data)
+        except Exception:
+            logger.exception(f"Error updating MR {iid} of project {project_id} with {data}")
+
+
+def put_mr(project_id: int, iid: int, data: dict):
     url = mr_url(project_id, iid)
+    invalidate('merge_request', project_id, iid)
     res = gitlab_session.put(url, json=data)
     res.raise_for_status()
-    return res.json()
+    mr = res.json()
+    store(('merge_request', project_id, iid), mr)
+    return mr
 
 
 def get_related_merge_requests(project_id: int, issue_iid: int):
     url = '{}/projects/{}/issues/{}/related_merge_requests'.format(
-            GITLAB_API_PREFIX, project_id, issue_iid)
+            gitlab_api_prefix(), project_id, issue_iid)
     return paginated_get(url)
 
 
 def comment_mr(project_id: int, iid: int, body: str, can_be_duplicated=True, min_time_between_comments=None):
     project_name = get_project_name(project_id)
-    can_comment_mr = config()['projects'][project_name].get('comment_mr', True)
+    can_comment_mr = compiled_config().projects[project_name].comment_mr
 
     if not can_comment_mr or not isinstance(can_comment_mr, bool):
         return
 
     if not can_be_duplicated:
-        # Ugly hack to drop user mentions from body
-        search_title = body.split(': ', 1)[-1]
-        res = gitlab_session.get(mr_url(project_id, iid) + '/notes')
-        res.raise_for_status()
-        comments = res.json()
-        if any(search_title in comment['body']
-                for comment in comments):
+        if notes_index.has_comment(project_id, iid, body):
             # This comment has already been made
             return
     elif min_time_between_comments is not None:
         # The comment can be duplicated, but to avoid flooding, wait at least
         # min_time_between_comments to duplicate them
-        # Ugly hack to drop user mentions from body
-        search_title = body.split(': ', 1)[-1]
-        res = gitlab_session.get(mr_url(project_id, iid) + '/notes')
-        res.raise_for_status()
-        comments = res.json()
-
-        def is_recent_comment(comment):
-            time_passed = datetime.datetime.utcnow() - parse_api_date(comment['created_at'])
-            return time_passed < min_time_between_comments
-
-        if any(is_recent_comment(comment) and
-               search_title.strip() in comment['body'].strip()
-               for comment in comments):
+        since = datetime.datetime.utcnow() - min_time_between_comments
+        if notes_index.has_comment(project_id, iid, body, since=since):
             return
 
     url = mr_url(project_id, iid) + '/notes'
     data = {"body": body}
     res = gitlab_session.post(url, json=data)
     res.raise_for_status()
-    return res.json()
+    note = res.json()
+    notes_index.add(project_id, iid, note)
+    return note
@@ -0,0 +1,102 @@
+"""Index of the comments the bot already made in each merge request.
+
+It is used to avoid repeating a comment without downloading and searching
+every note of the MR each time. The index of a MR is refreshed only with
+the notes created since the last refresh, and fully rebuilt once it
+expires.
+"""
+import datetime
+import hashlib
+import threading
+import time
+
+from gorrabot.api.gitlab import gitlab_api_prefix, gitlab_self_username
+from gorrabot.api.gitlab.utils import iter_paginated
+from gorrabot.api.utils import parse_api_date
+from gorrabot.ttl_cache import TTLCache
+
+# Seconds during which the index of a MR is trusted without asking GitLab
+# for new notes
+NOTES_REFRESH_INTERVAL = 60
+
+# Seconds after which the index of a MR is rebuilt from scratch, so
+# deleted comments are eventually forgotten
+NOTES_INDEX_TTL = 24 * 60 * 60
+
+
+def comment_fingerprint(body: str) -> str:
+    # Ugly hack to drop user mentions from body
+    text = body.split(': ', 1)[-1].strip()
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class MergeRequestNotes:
+    """Bot comments of a single MR"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_note_id = 0
+        self.refreshed_at = None
+        # note id -> (fingerprint, created_at)
+        self.comments = {}
+
+    def add(self, note: dict):
+        self.comments[note['id']] = (comment_fingerprint(note['body']), parse_api_date(note['created_at']))
+
+    def refresh(self, project_id: int, iid: int):
+        url = f'{gitlab_api_prefix()}/projects/{project_id}/merge_requests/{iid}/notes'
+        filters = {'sort': 'desc', 'order_by': 'created_at'}
+        newest_note_id = self.last_note_id
+        for note in iter_paginated(url, filters):
+            if note['id'] <= self.last_note_id:
+                # Everything from here on was already indexed
+                break
+            newest_note_id = max(newest_note_id, note['id'])
+            if not note.get('system') and note['author']['username'] == gitlab_self_username():
+                self.add(note)
+        self.last_note_id = newest_note_id
+        self.refreshed_at = time.monotonic()
+
+    def is_outdated(self) -> bool:
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at > NOTES_REFRESH_INTERVAL
+
+
+class NotesIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._merge_requests = TTLCache(maxsize=2000, ttl=NOTES_INDEX_TTL)
+
+    def _get(self, project_id: int, iid: int) -> MergeRequestNotes:
+        key = (str(project_id), str(iid))
+        with self._lock:
+            notes = self._merge_requests.get(key)
+            if notes is None:
+                notes = MergeRequestNotes()
+                self._merge_requests.set(key, notes)
+            return notes
+
+    def has_comment(self, project_id: int, iid: int, body: str, since: datetime.datetime = None) -> bool:
+        """Whether the bot already commented body in the MR, after since if given"""
+        fingerprint = comment_fingerprint(body)
+        notes = self._get(project_id, iid)
+        with notes.lock:
+            if notes.is_outdated():
+                notes.refresh(project_id, iid)
+            return any(
+                note_fingerprint == fingerprint and (since is None or created_at > since)
+                for note_fingerprint, created_at in notes.comments.values()
+            )
+
+    def add(self, project_id: int, iid: int, note: dict):
+        """Record a note the bot just posted.
+
+        last_note_id is not moved, so notes posted meanwhile by other
+        processes are still picked up by the next refresh.
+        """
+        notes = self._get(project_id, iid)
+        with notes.lock:
+            notes.add(note)
+
+
+notes_index = NotesIndex()
@@ -1,7 +1,34 @@
-from gorrabot.api.gitlab import GITLAB_API_PREFIX, gitlab_session
+from gorrabot.api.gitlab import gitlab_api_prefix, gitlab_session
+from gorrabot.config import compiled_config
+from gorrabot.ttl_cache import TTLCache
+
+# Names of projects that are not in the configuration (e.g. forks) are
+# asked to GitLab and remembered for this amount of seconds
+UNCONFIGURED_PROJECT_NAME_TTL = 3600
+
+_unconfigured_project_names = TTLCache(maxsize=512, ttl=UNCONFIGURED_PROJECT_NAME_TTL)
 
 
 def get_project_name(project_id: int):
-    res = gitlab_session.get(GITLAB_API_PREFIX + f'/projects/{project_id}')
-    res.raise_for_status()
-    return res.json()['name']
+    try:
+        project_id = int(project_id)
+    except (TypeError, ValueError):
+        # Not a numeric id (e.g. URL-encoded path), ask GitLab
+        pass
+    project = compiled_config().projects_by_id.get(project_id)
+    if project is not None:
+        return project.name
+
+    project_name = _unconfigured_project_names.get(project_id)
+    if project_name is None:
+        res = gitlab_session.get(gitlab_api_prefix() + f'/projects/{project_id}')
+        res.raise_for_status()
+        project_name = res.json()['name']
+        _unconfigured_project_names.set(project_id, project_name)
+    return project_name
+
+
+def get_project_id(project_name: str):
+    """Return the id of a configured project, or None if it isn't configured"""
+    project = compiled_config().projects.get(project_name)
+    return project.id if project is not None else None
@@ -0,0 +1,118 @@
+"""Read cache scoped to the handling of a single event.
+
+While an event is being handled, every GitLab read that goes through
+``cached_get`` is done at most once: later callers get the same response.
+Writes invalidate the entries of the object they modify. Outside of an
+``event_scope`` nothing is cached.
+
+Writes can also be deferred with ``defer_write``: the changes to the same
+object are merged, and the handler flushes them once at the end of the
+event.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_scope = ContextVar('gitlab_event_scope', default=None)
+
+
+class EventScope:
+    def __init__(self):
+        self.responses = {}
+        # key -> merged data of the deferred writes, in the order the
+        # objects were first written
+        self.deferred_writes = {}
+
+
+def _normalize_key(key: tuple) -> tuple:
+    # Project ids and iids come both as int (API data) and str (regex
+    # matches), so they must compare equal
+    return tuple(str(part) for part in key)
+
+
+@contextmanager
+def event_scope():
+    scope = EventScope()
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+def current_scope():
+    return _current_scope.get()
+
+
+def cached_get(key: tuple, fetch):
+    """Return the cached value of ``key``, calling ``fetch()`` only on a miss"""
+    scope = _current_scope.get()
+    if scope is None:
+        return fetch()
+    key = _normalize_key(key)
+    if key not in scope.responses:
+        scope.responses[key] = fetch()
+    return scope.responses[key]
+
+
+def store(key: tuple, value):
+    """Save a value already known to be fresh, e.g. the response of a write"""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.responses[_normalize_key(key)] = value
+
+
+def cached(key: tuple):
+    """The cached value of ``key``, or None"""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    return scope.responses.get(_normalize_key(key))
+
+
+def pending_write(key: tuple):
+    """The pending write of ``key``, a dict the caller can modify, or None
+    when there is no event scope and the caller must write right away"""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    return scope.deferred_writes.setdefault(_normalize_key(key), {})
+
+
+def pending_changes(key: tuple):
+    """A copy of the pending write of ``key``, or None if there is none"""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    changes = scope.deferred_writes.get(_normalize_key(key))
+    return dict(changes) if changes else None
+
+
+def defer_write(key: tuple, data: dict) -> bool:
+    """Merge ``data`` into the pending write of ``key``. Return False when
+    there is no event scope, so the caller must write right away"""
+    pending = pending_write(key)
+    if pending is None:
+        return False
+    pending.update(data)
+    return True
+
+
+def pop_deferred_writes(kind: str):
+    """Remove and return the (key, data) pending writes whose key starts
+    with ``kind``"""
+    scope = _current_scope.get()
+    if scope is None:
+        return []
+    keys = [key for key in scope.deferred_writes if key[0] == kind]
+    return [(key, scope.deferred_writes.pop(key)) for key in keys]
+
+
+def invalidate(*prefix):
+    """Drop every cached entry whose key starts with ``prefix``"""
+    scope = _current_scope.get()
+    if scope is None:
+        return
+    prefix = _normalize_key(prefix)
+    for key in list(scope.responses):
+        if key[:len(prefix)] == prefix:
+            del scope.responses[key]
@@ -0,0 +1,148 @@
+"""requests session for the GitLab API that copes with its rate limits.
+
+Before each request it waits if the RateLimit-* headers of the previous
+responses say the limit is about to be reached, spreading the requests
+left until the window resets. Requests rejected with 429 are retried,
+and so are idempotent requests that fail with a 5xx or a connection
+error, with jittered exponential backoff that honors Retry-After. With
+an ETagCache, GET requests of the endpoints it caches are conditional.
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from gorrabot.api.gitlab.http_cache import ETagCache
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open to GitLab, enough for the webhook workers plus
+# the page prefetching and the thread pools of the cron jobs
+POOL_SIZE = 32
+# Seconds
+DEFAULT_TIMEOUT = 30
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+MAX_RETRY_DELAY = 60
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+# Requests start being spread over the rest of the rate limit window when
+# fewer than this are left
+THROTTLE_THRESHOLD = 50
+MAX_THROTTLE_DELAY = 10
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full jitter exponential backoff"""
+    return random.uniform(0, min(MAX_RETRY_DELAY, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after(res: requests.Response):
+    """Seconds the Retry-After header asks to wait, or None"""
+    value = res.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitState:
+    """What the last response said about the rate limit window"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = None
+        self.reset_at = None
+
+    def update(self, res: requests.Response):
+        remaining = res.headers.get('RateLimit-Remaining')
+        reset_at = res.headers.get('RateLimit-Reset')
+        if remaining is None or reset_at is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            self.reset_at = int(reset_at)
+
+    def delay(self) -> float:
+        """Seconds to wait before the next request. It also counts the
+        request, so concurrent callers get increasing delays"""
+        with self._lock:
+            if self.remaining is None:
+                return 0
+            now = time.time()
+            if self.reset_at <= now:
+                self.remaining = None
+                return 0
+            remaining = self.remaining
+            self.remaining = max(remaining - 1, 0)
+        if remaining > THROTTLE_THRESHOLD:
+            return 0
+        return min((self.reset_at - now) / (remaining + 1), MAX_THROTTLE_DELAY)
+
+
+class GitlabSession(requests.Session):
+
+    def __init__(self, pool_size: int = POOL_SIZE, etag_cache: ETagCache = None):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.rate_limit = RateLimitState()
+        self.etag_cache = etag_cache
+
+    def send(self, request, **kwargs):
+        if self.etag_cache is None or not self.etag_cache.is_cacheable(request):
+            return super().send(request, **kwargs)
+        cached = self.etag_cache.get(request.url)
+        if cached is not None:
+            request.headers['If-None-Match'] = cached.etag
+        res = super().send(request, **kwargs)
+        if res.status_code == 304 and cached is not None:
+            return cached.to_response(res)
+        if res.status_code == 200 and 'ETag' in res.headers:
+            self.etag_cache.set(request.url, res)
+        elif res.status_code == 404:
+            self.etag_cache.discard(request.url)
+        return res
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            delay = self.rate_limit.delay()
+            if delay:
+                logger.info(f"Close to the GitLab rate limit, waiting {delay:.1f}s")
+                time.sleep(delay)
+            try:
+                res = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent or attempt >= MAX_RETRIES:
+                    raise
+                reason = type(e).__name__
+                delay = backoff_delay(attempt)
+            else:
+                self.rate_limit.update(res)
+                # A 429 means the request was not processed, so it can be
+                # retried whatever the method
+                retry = res.status_code == 429 or (idempotent and res.status_code in RETRY_STATUSES)
+                if not retry or attempt >= MAX_RETRIES:
+                    return res
+                reason = res.status_code
+                delay = retry_after(res)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                delay = min(delay, MAX_RETRY_DELAY)
+            attempt += 1
+            logger.warning(f"GitLab {method} {url} failed ({reason}), retry {attempt} in {delay:.1f}s")
+            time.sleep(delay)
@@ -1,6 +1,6 @@
 import logging
 
-from gorrabot.api.gitlab import gitlab_session, GITLAB_API_PREFIX
+from gorrabot.api.gitlab import gitlab_session, gitlab_api_prefix
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +13,7 @@ def get_username(data: dict):
         return data['author']['username']
 
     user_id = data['object_attributes']['author_id']
-    res = gitlab_session.get(GITLAB_API_PREFIX + f'/users/{user_id}')
+    res = gitlab_session.get(gitlab_api_prefix() + f'/users/{user_id}')
     if res.status_code != 200:
         logger.error(f"Could not get users from gitlab {res.status_code}")
     res.raise_for_status()
@@ -27,6 +27,6 @@ def get_usernames_from_mr_or_issue(data: dict):
         return [data['author']['username']]
 
     user_id = data['object_attributes']['author_id']
-    res = gitlab_session.get(GITLAB_API_PREFIX + f'/users/{user_id}')
+    res = gitlab_session.get(gitlab_api_prefix() + f'/users/{user_id}')
     res.raise_for_status()
     return [res.json()['username']]
@@ -1,14 +1,79 @@
+from collections import deque
+
 from gorrabot.api.gitlab import gitlab_session
+from gorrabot.telemetry import ContextThreadPoolExecutor, parallelism
+
+# Number of pages of a list endpoint fetched at the same time
+PREFETCH_WORKERS = 4
 
+# Pages are fetched one at a time when GitLab reports fewer remaining
+# requests than this in the current rate limit window
+RATE_LIMIT_RESERVE = 100
 
-def paginated_get(url: str, filters: dict = None, actual_page: int = 1):
-    if filters is None:
-        filters = {}
-    filters['page'] = actual_page
-    res = gitlab_session.get(url, params=filters)
+
+def _get_page(url: str, params: dict, page: int):
+    res = gitlab_session.get(url, params=dict(params, page=page))
     res.raise_for_status()
-    if int(res.headers['X-Total-Pages']) > actual_page:
-        return res.json() + paginated_get(url, filters, actual_page+1)
-    else:
-        return res.json()
+    return res
+
+
+def _has_rate_limit_headroom(res) -> bool:
+    remaining = res.headers.get('RateLimit-Remaining')
+    return remaining is None or int(remaining) > RATE_LIMIT_RESERVE
+
+
+def _iter_prefetched_pages(url: str, params: dict, pages: range, max_workers: int):
+    """Fetch pages concurrently, keeping at most max_workers in flight, and
+    yield the responses in page order"""
+    pages = iter(pages)
+    window = max_workers
+    pending = deque()
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                while len(pending) < window:
+                    page = next(pages, None)
+                    if page is None:
+                        break
+                    pending.append(executor.submit(_get_page, url, params, page))
+                if not pending:
+                    return
+                res = pending.popleft().result()
+                if not _has_rate_limit_headroom(res):
+                    window = 1
+                yield res
+        finally:
+            # The consumer may stop before the last page
+            for future in pending:
+                future.cancel()
+
+
+def iter_paginated(url: str, filters: dict = None, max_workers: int = 1):
+    """Yield the items of a paginated GitLab endpoint, one page at a time.
+
+    With max_workers > 1, once the first page tells the total number of
+    pages, the rest are fetched concurrently, unless called from a thread
+    pool task.
+    """
+    max_workers = parallelism(max_workers)
+    params = dict(filters or {})
+    res = _get_page(url, params, 1)
+    yield from res.json()
+
+    total_pages = res.headers.get('X-Total-Pages')
+    if max_workers > 1 and total_pages and _has_rate_limit_headroom(res):
+        for res in _iter_prefetched_pages(url, params, range(2, int(total_pages) + 1), max_workers):
+            yield from res.json()
+        return
+
+    # X-Total-Pages is not sent for very large collections, but
+    # X-Next-Page always is
+    next_page = res.headers.get('X-Next-Page')
+    while next_page:
+        res = _get_page(url, params, int(next_page))
+        yield from res.json()
+        next_page = res.headers.get('X-Next-Page')
+
 
+def paginated_get(url: str, filters: dict = None, max_workers: int = 1):
+    return list(iter_paginated(url, filters, max_workers))
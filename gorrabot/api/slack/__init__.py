@@ -1,9 +1,29 @@
 import os
 import requests
 
-BOT_TOKEN = os.environ['SLACK_BOT_TOKEN']
-SLACK_REQUEST_TOKEN = os.environ.get('SLACK_REQUEST_TOKEN')
-SLACK_API_PREFIX = "https://slack.com/api"
+from gorrabot.metrics import instrument_session
+
+
+# The environment is read when it's needed, so importing this module
+# doesn't require it
+def slack_api_prefix() -> str:
+    return os.environ.get('SLACK_API_URL', "https://slack.com/api")
+
+
+def slack_bot_token() -> str:
+    return os.environ['SLACK_BOT_TOKEN']
+
+
+def slack_request_token():
+    return os.environ.get('SLACK_REQUEST_TOKEN')
+
+
+class BotTokenAuth(requests.auth.AuthBase):
+    def __call__(self, request):
+        request.prepare_url(request.url, {"token": slack_bot_token()})
+        return request
+
 
 slack_session = requests.Session()
-slack_session.params["token"] = BOT_TOKEN
+slack_session.auth = BotTokenAuth()
+instrument_session(slack_session, 'slack')
@@ -0,0 +1,63 @@
+import logging
+import time
+from collections import OrderedDict
+
+from gorrabot.api.slack.messages import send_message_to_user
+from gorrabot.api.slack.rate_limit import TokenBucket
+from gorrabot.telemetry import ContextThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Messages sent per second across all the channels
+MESSAGES_PER_SECOND = 4
+# Slack allows about one message per second in the same channel
+CHANNEL_INTERVAL = 1
+# Users whose messages are being delivered at the same time
+DISPATCH_WORKERS = 4
+# Times a message is retried after Slack answers 429
+MAX_RETRIES = 3
+
+
+class SlackDispatcher:
+    """Deliver direct messages to many users concurrently, within Slack's
+    rate limits.
+
+    Messages are queued with send() and delivered by flush(). Messages to
+    the same user keep the order they were queued in.
+    """
+
+    def __init__(self, user_index: dict, messages_per_second: float = MESSAGES_PER_SECOND,
+                 max_workers: int = DISPATCH_WORKERS):
+        self.user_index = user_index
+        self.max_workers = max_workers
+        self._bucket = TokenBucket(messages_per_second, capacity=messages_per_second)
+        self._queued = OrderedDict()
+
+    def send(self, slack_user: str, text: str):
+        self._queued.setdefault(slack_user, []).append(text)
+
+    def flush(self):
+        queued, self._queued = self._queued, OrderedDict()
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for future in [executor.submit(self._deliver, slack_user, texts)
+                           for slack_user, texts in queued.items()]:
+                future.result()
+
+    def _deliver(self, slack_user: str, texts: list):
+        last_sent_at = None
+        for text in texts:
+            if last_sent_at is not None:
+                time.sleep(max(0, CHANNEL_INTERVAL - (time.monotonic() - last_sent_at)))
+            self._send_one(slack_user, text)
+            last_sent_at = time.monotonic()
+
+    def _send_one(self, slack_user: str, text: str):
+        for _ in range(MAX_RETRIES + 1):
+            self._bucket.acquire()
+            res = send_message_to_user(slack_user, text, self.user_index)
+            if res is None or res.status_code != 429:
+                return res
+            retry_after = float(res.headers.get('Retry-After', 1))
+            logger.warning(f"Slack rate limit reached, retrying in {retry_after} seconds")
+            self._bucket.pause(retry_after)
+        logger.error(f"Could not send message to {slack_user}, Slack rate limit reached")
@@ -1,8 +1,9 @@
 import os
 
 from gorrabot.api.gitlab.projects import get_project_name
-from gorrabot.api.slack import slack_session, SLACK_API_PREFIX
-from gorrabot.config import config, DEBUG_MODE, NOTIFY_DEFAULT_CHANNEL, NOTIFY_DEBUG_CHANNEL
+from gorrabot.api.slack import slack_session, slack_api_prefix
+from gorrabot.api.slack.outbox import SlackOutbox
+from gorrabot.config import compiled_config, DEBUG_MODE, NOTIFY_DEFAULT_CHANNEL, NOTIFY_DEBUG_CHANNEL
 
 
 def check_can_send_slack_messages(project_id=None):
@@ -15,27 +16,26 @@ def check_can_send_slack_messages(project_id=None):
     project_name = get_project_name(project_id)
 
     send_message_to_slack = False
-    if project_name in config()['projects']:
-        send_message_to_slack = config()['projects'][project_name].get('send_message_to_slack', True)
+    project = compiled_config().projects.get(project_name)
+    if project is not None:
+        send_message_to_slack = project.send_message_to_slack
 
     return send_message_to_slack
 
 
-def send_message_to_user(slack_user: str, text: str, slack_users_data: dict):
-    slack_users_data = {
-        elem["name"]: elem for elem in slack_users_data["members"] if not elem['deleted'] and not elem["is_bot"]
-    }
-
-    if slack_user not in slack_users_data:
+def send_message_to_user(slack_user: str, text: str, slack_user_index: dict):
+    """Send a direct message. slack_user_index is the one returned by
+    get_slack_user_index"""
+    if slack_user not in slack_user_index:
         print(f"Ask for send message to user: {slack_user}, who is not in the slack api response")
         return None
     else:
         params = {
-            "channel": slack_users_data[slack_user]['id'],
+            "channel": slack_user_index[slack_user]['id'],
             "text": text,
             "as_user": True
         }
-        res = slack_session.post(f"{SLACK_API_PREFIX}/chat.postMessage", params=params)
+        res = slack_session.post(f"{slack_api_prefix()}/chat.postMessage", params=params)
         return res
 
 
@@ -52,15 +52,20 @@ def send_message_to_channel(slack_channel: str, text: str, project_id=None, forc
         "text": text,
         "link_names": True
     }
-    res = slack_session.post(f"{SLACK_API_PREFIX}/chat.postMessage", params=params)
+    res = slack_session.post(f"{slack_api_prefix()}/chat.postMessage", params=params)
     return res
 
 
+# Error and debug messages are sent in background, so Slack never slows
+# down the handling of events
+outbox = SlackOutbox(send_message_to_channel)
+
+
 def send_message_to_error_channel(text: str, project_id: int, force_send=False):
     if not DEBUG_MODE and NOTIFY_DEFAULT_CHANNEL:
-        send_message_to_channel(NOTIFY_DEFAULT_CHANNEL, text, project_id, force_send=True)
+        outbox.enqueue(NOTIFY_DEFAULT_CHANNEL, text, project_id, force_send=True)
 
 
 def send_debug_message(text: str):
     if 'DEBUG' in os.environ and NOTIFY_DEBUG_CHANNEL:
-        send_message_to_channel(NOTIFY_DEBUG_CHANNEL, text)  # erich ID
+        outbox.enqueue(NOTIFY_DEBUG_CHANNEL, text)  # erich ID
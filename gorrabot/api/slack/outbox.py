@@ -0,0 +1,111 @@
+import atexit
+import logging
+import threading
+import time
+from queue import Queue, Empty, Full
+
+import requests
+
+from gorrabot.api.slack.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Messages waiting to be sent, new ones are dropped when it's full
+OUTBOX_MAX_SIZE = 1000
+# Seconds to wait for more messages to batch with the first one
+BATCH_WINDOW = 0.5
+# Slack truncates messages longer than 40000 characters, stay well below
+MAX_BATCH_LENGTH = 3500
+MAX_RETRIES = 3
+# Seconds waited at exit for queued messages to be sent
+EXIT_FLUSH_TIMEOUT = 10
+
+
+class SlackOutbox:
+    """Send channel messages from a background thread.
+
+    enqueue() returns immediately. Messages for the same channel that are
+    queued close in time are joined in a single post, and failed posts are
+    retried.
+    """
+
+    def __init__(self, send, messages_per_second: float = 1):
+        self._send = send
+        self._queue = Queue(maxsize=OUTBOX_MAX_SIZE)
+        self._bucket = TokenBucket(messages_per_second, capacity=3)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slack-outbox', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, EXIT_FLUSH_TIMEOUT)
+
+    def enqueue(self, channel: str, text: str, project_id=None, force_send=False):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((channel, project_id, force_send, text))
+        except Full:
+            logger.warning(f"Slack outbox is full, dropping message to {channel}")
+
+    def flush(self, timeout: float = None):
+        """Wait until the queued messages are sent, at most timeout seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _next_batch(self):
+        messages = [self._queue.get()]
+        deadline = time.monotonic() + BATCH_WINDOW
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                messages.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+
+        batches = {}
+        for channel, project_id, force_send, text in messages:
+            groups = batches.setdefault((channel, project_id, force_send), [[]])
+            if sum(len(t) + 1 for t in groups[-1]) + len(text) > MAX_BATCH_LENGTH:
+                groups.append([])
+            groups[-1].append(text)
+        return len(messages), [
+            (key, '\n'.join(texts))
+            for key, groups in batches.items()
+            for texts in groups
+        ]
+
+    def _run(self):
+        while True:
+            count, batches = self._next_batch()
+            try:
+                for (channel, project_id, force_send), text in batches:
+                    self._post(channel, text, project_id, force_send)
+            finally:
+                for _ in range(count):
+                    self._queue.task_done()
+
+    def _post(self, channel: str, text: str, project_id, force_send: bool):
+        for attempt in range(MAX_RETRIES + 1):
+            self._bucket.acquire()
+            try:
+                res = self._send(channel, text, project_id, force_send=force_send)
+            except requests.RequestException as e:
+                logger.warning(f"Could not send Slack message to {channel}: {e}")
+                self._bucket.pause(2 ** attempt)
+                continue
+            except Exception:
+                logger.exception(f"Could not send Slack message to {channel}")
+                return
+            if res is None or (res.status_code != 429 and res.status_code < 500):
+                return
+            self._bucket.pause(float(res.headers.get('Retry-After', 2 ** attempt)))
+        logger.error(f"Giving up sending Slack message to {channel}")
@@ -1,9 +1,17 @@
-from gorrabot.api.slack import slack_session, SLACK_API_PREFIX
+from gorrabot.api.slack import slack_session, slack_api_prefix
 
 
 def get_slack_user_data():
-    res = slack_session.get(f"{SLACK_API_PREFIX}/users.list")
+    res = slack_session.get(f"{slack_api_prefix()}/users.list")
     res.raise_for_status()
     data = res.json()
     assert data["ok"]
     return data
+
+
+def get_slack_user_index():
+    """Active, non-bot members of the workspace, by name"""
+    data = get_slack_user_data()
+    return {
+        elem["name"]: elem for elem in data["members"] if not elem['deleted'] and not elem["is_bot"]
+    }
@@ -4,3 +4,14 @@ import datetime
 def parse_api_date(date):  # TODO I DO NOT LIKE THIS HERE
     assert date.endswith('Z')
     return datetime.datetime.fromisoformat(date[:-1])
+
+
+def parse_webhook_date(date):
+    """Webhooks send dates as "2013-12-03 17:23:34 UTC", or in ISO format
+    like the API in recent GitLab versions. Raises ValueError for other
+    formats"""
+    if date.endswith(' UTC'):
+        return datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S UTC')
+    if date.endswith('Z'):
+        return datetime.datetime.fromisoformat(date[:-1])
+    raise ValueError(f"Unknown webhook date format: {date}")
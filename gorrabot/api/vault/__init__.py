@@ -12,4 +12,4 @@ GORRABOT_CONFIG_FILE = {
     'path_regex': '^(/[^/ ]*)+/?$'
 }
 
-from .utils import get_secret
+from .utils import get_secret, get_secret_with_version, get_secret_version, VaultError
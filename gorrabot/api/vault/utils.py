@@ -1,17 +1,100 @@
-import hvac
-from hvac.exceptions import InvalidRequest
+import logging
+import threading
+
+import requests
+
 from . import VAULT_SERVER, ROLE_ID, SECRET_ID, SKIP_VAULT
 
+logger = logging.getLogger(__name__)
+
 ERROR_MESSAGE = "VaultError: {}"
+SECRETS_MOUNT_POINT = 'secrets'
+SECRETS_PATH = 'gorrabot'
+
+
+class VaultError(Exception):
+    pass
+
+
+_client = None
+_client_lock = threading.Lock()
+
 
-if not SKIP_VAULT:
+def get_client():
+    """ Returns a Vault client, logging in on the first call
+
+    :raises VaultError: if the login fails
+    """
+    global _client
+    if SKIP_VAULT:
+        raise VaultError("Vault is disabled with SKIP_VAULT")
+    with _client_lock:
+        if _client is None:
+            import hvac
+            from hvac.exceptions import VaultError as HvacError
+            try:
+                client = hvac.Client(url=VAULT_SERVER)
+                client.auth.approle.login(role_id=ROLE_ID, secret_id=SECRET_ID)
+            except (HvacError, requests.RequestException) as e:
+                raise VaultError(f"Cannot connect to Vault server, {e}") from e
+            _client = client
+        elif not _client.is_authenticated():
+            _client.auth.approle.login(role_id=ROLE_ID, secret_id=SECRET_ID)
+        return _client
+
+
+def get_secret_version():
+    """ Gets the current version of the gorrabot secrets, without reading them
+    when the role can read the secret metadata
+
+    :return: Version number
+    :rtype: int
+    :raises VaultError: if Vault can't be queried
+    """
+    from hvac.exceptions import VaultError as HvacError
     try:
-        client = hvac.Client(url=VAULT_SERVER)
-        client.auth.approle.login(role_id=ROLE_ID, secret_id=SECRET_ID)
-    except InvalidRequest as e:
-        message = f"Cannot connect to Vault server, {e}"
-        print(ERROR_MESSAGE.format(message))
-        exit(1)
+        metadata = get_client().secrets.kv.v2.read_secret_metadata(
+            mount_point=SECRETS_MOUNT_POINT,
+            path=SECRETS_PATH
+        )
+        return metadata['data']['current_version']
+    except (HvacError, KeyError) as e:
+        # Roles with only read permission on the secret can't read its
+        # metadata, the version is also in the secret itself
+        logger.debug(f"Cannot read secret metadata, {e}")
+    except requests.RequestException as e:
+        raise VaultError(f"Cannot read secret metadata, {e}") from e
+    try:
+        secret = get_client().secrets.kv.v2.read_secret_version(
+            mount_point=SECRETS_MOUNT_POINT,
+            path=SECRETS_PATH
+        )
+        return secret['data']['metadata']['version']
+    except (HvacError, requests.RequestException, KeyError) as e:
+        raise VaultError(f"Cannot read secret version, {e}") from e
+
+
+def get_secret_with_version(secret_name):
+    """ Gets a given secret from Vault, along with the version it belongs to
+
+    :param secret_name: Name of the secret stored in Vault
+    :type secret_name: str
+    :return: Secret's content and version
+    :rtype: tuple
+    :raises VaultError: if the secret can't be read
+    """
+    from hvac.exceptions import VaultError as HvacError
+    try:
+        secret_response = get_client().secrets.kv.v2.read_secret_version(
+            mount_point=SECRETS_MOUNT_POINT,
+            path=SECRETS_PATH
+        )
+        data = secret_response['data']
+        return data['data'][secret_name], data['metadata']['version']
+    except KeyError as e:
+        raise VaultError(f"Secret {e} could not be found") from e
+    except (HvacError, requests.RequestException) as e:
+        raise VaultError(f"Cannot read secret, {e}") from e
 
 
 def get_secret(secret_name):
@@ -23,14 +106,7 @@ def get_secret(secret_name):
     :rtype: str if secrets exists, Exception otherwise
     """
     try:
-        if not client.is_authenticated():
-            client.auth.approle.login(role_id=ROLE_ID, secret_id=SECRET_ID)
-        secret_response = client.secrets.kv.v2.read_secret_version(
-            mount_point='secrets',
-            path='gorrabot'
-        )
-        return secret_response['data']['data'][secret_name]
-    except KeyError as e:
-        message = f"Secret {e} could not be found"
-        print(ERROR_MESSAGE.format(message))
+        return get_secret_with_version(secret_name)[0]
+    except VaultError as e:
+        print(ERROR_MESSAGE.format(e))
         exit(1)
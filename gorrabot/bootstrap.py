@@ -0,0 +1,37 @@
+"""Explicit initialization of the gorrabot processes.
+
+Importing gorrabot doesn't read the environment, log in to Vault or load
+the config, all of that is done lazily on first use. Entry points call
+bootstrap() before doing any work, so a broken setup makes them fail at
+startup instead of when the first event arrives.
+"""
+import logging
+import os
+import threading
+import time
+
+from gorrabot.config import config
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_ENVIRONMENT = ['GITLAB_TOKEN', 'GITLAB_CHECK_TOKEN', 'GITLAB_BOT_USERNAME', 'SLACK_BOT_TOKEN']
+
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
+
+
+def bootstrap():
+    """Check the environment and load the config. Only the first call does
+    something"""
+    global _bootstrapped
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return
+        start = time.monotonic()
+        missing = [name for name in REQUIRED_ENVIRONMENT if name not in os.environ]
+        if missing:
+            print(f"Missing environment variables: {', '.join(missing)}")
+            exit(1)
+        config()
+        _bootstrapped = True
+        logger.info(f"Bootstrap finished in {time.monotonic() - start:.2f}s")
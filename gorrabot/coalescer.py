@@ -0,0 +1,83 @@
+"""Hold merge request events for a short window and keep only the latest.
+
+Editing labels, assignee, milestone and title of a MR at once makes GitLab
+send one update event for each change. handle_mr only looks at the state
+of the MR in the event, so handling the last one of the burst is enough.
+"""
+import logging
+import os
+import threading
+import time
+
+from gorrabot.metrics import Gauge
+from gorrabot.worker_factory import ShardedBuffer, buffer, shard_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds MR events are held waiting for newer events of the same MR, 0
+# disables coalescing
+COALESCE_WINDOW = float(os.environ.get('GORRABOT_COALESCE_WINDOW', 2))
+
+
+class EventCoalescer:
+    """Front of a ShardedBuffer that debounces MR events by (project_id, iid).
+
+    The first event of a MR is held for window seconds. Events of the same
+    MR received meanwhile replace it, so it is dispatched at most window
+    seconds after the burst started, with the latest state. Held events are
+    already journaled, and the replaced ones are acknowledged.
+    """
+
+    def __init__(self, buffer: ShardedBuffer, window: float):
+        self.buffer = buffer
+        self.window = window
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def _ensure_started(self):
+        # Called with the condition held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-coalescer', daemon=True)
+            self._thread.start()
+
+    def put(self, event: dict):
+        if self.window <= 0 or event.get('object_kind') != 'merge_request':
+            self.buffer.put(event)
+            return
+        key = shard_key(event)
+        job = self.buffer.journal(event)
+        with self._condition:
+            self._ensure_started()
+            held = self._pending.get(key)
+            if held is None:
+                self._pending[key] = [time.monotonic() + self.window, job]
+                self._condition.notify()
+                return
+            superseded, held[1] = held[1], job
+        logger.info(f"Coalescing MR event {key}")
+        self.buffer.ack(superseded)
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _pop_due(self):
+        """Wait until some event is due and return the due ones"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [key for key, (deadline, _) in self._pending.items() if deadline <= now]
+                if due:
+                    return [self._pending.pop(key)[1] for key in due]
+                timeout = min((deadline for deadline, _ in self._pending.values()), default=now + 60) - now
+                self._condition.wait(timeout)
+
+    def _run(self):
+        while True:
+            for job in self._pop_due():
+                self.buffer.dispatch(job)
+
+
+coalescer = EventCoalescer(buffer, COALESCE_WINDOW)
+Gauge('gorrabot_coalescing_events', 'MR events held waiting for newer events of the same MR', coalescer.pending)
@@ -4,10 +4,12 @@ import logging
 import os
 
 from gorrabot.api.gitlab.merge_requests import comment_mr
+from gorrabot.bootstrap import bootstrap
+from gorrabot.telemetry import operation
 from gorrabot.api.gitlab.usernames import get_username
-from gorrabot.constants import OLD_MEMBERS, MSG_MR_OLD_MEMBER, stale_mr_message_interval, MSG_STALE_MR
+from gorrabot.constants import MSG_MR_OLD_MEMBER, MSG_STALE_MR
 from gorrabot.utils import get_staled_merge_requests
-from gorrabot.config import config
+from gorrabot.config import compiled_config
 
 """"(
     comment_mr,
@@ -28,29 +30,31 @@ handler.setFormatter(formatter)
 root.addHandler(handler)
 logger = logging.getLogger(__name__)
 
-project_ids = [int(config()['projects'][project_name]['id']) for project_name in config()['projects']]
-
 
+@operation('comment_stale_merge_requests')
 def main():
+    bootstrap()
     logger.info("Starting stale MR check")
+    settings = compiled_config().gitlab
+    project_ids = [project.id for project in compiled_config().projects.values() if project.id is not None]
     for project_id in project_ids:
         staled = list(get_staled_merge_requests(project_id, wip='yes'))
         logger.info(f'Found {len(staled)} staled merge requests in project: {project_id}')
         for mr in staled:
             username = get_username(mr)
-            if username in OLD_MEMBERS:
+            if username in settings.old_members:
                 comment_mr(
                     project_id,
                     mr['iid'],
                     f'{MSG_MR_OLD_MEMBER}',
-                    min_time_between_comments=stale_mr_message_interval
+                    min_time_between_comments=settings.stale_mr_message_interval
                 )
             else:
                 comment_mr(
                     project_id,
                     mr['iid'],
                     f'@{username}: {MSG_STALE_MR}',
-                    min_time_between_comments=stale_mr_message_interval
+                    min_time_between_comments=settings.stale_mr_message_interval
                 )
 
 
@@ -1,44 +1,169 @@
+import logging
 import os
-import yaml
+import tempfile
+import threading
 import re
-from functools import lru_cache
 
-from gorrabot.api.vault import SECRETS, GORRABOT_CONFIG_FILE, get_secret
+from gorrabot.api.vault import (
+    SECRETS,
+    GORRABOT_CONFIG_FILE,
+    get_secret_with_version,
+    get_secret_version,
+    VaultError,
+)
+from gorrabot.project_config import CompiledConfig, compile_config
 
+logger = logging.getLogger(__name__)
 
 DEBUG_MODE = os.environ.get('GORRABOT_DEBUG')
 NOTIFY_DEFAULT_CHANNEL = os.environ.get('NOTIFY_DEFAULT_CHANNEL')
 NOTIFY_DEBUG_CHANNEL = os.environ.get('NOTIFY_DEBUG_CHANNEL')
+# Directory where data that can be reused by later runs is saved
+CACHE_DIR = os.environ.get('GORRABOT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gorrabot'))
+
+
+class ConfigError(Exception):
+    pass
 
 
 def load_yaml(data):  # TODO I DO NOT LIKE THIS HERE
+    import yaml
     try:
         return yaml.safe_load(data)
     except yaml.YAMLError as exc:
-        print(exc)
-        exit(1)
+        raise ConfigError(exc)
 
 
-@lru_cache(maxsize=None)
-def config() -> dict:
-    secret = get_secret(SECRETS['config']) if 'config' in SECRETS else GORRABOT_CONFIG_FILE['path']
-    if not secret:
-        print("Invalid secret: Be sure you've set either CONFIG_SECRET_NAME or GORRABOT_CONFIG_FILE")
-        exit(1)
+def _is_path(secret: str) -> bool:
+    return bool(re.match(GORRABOT_CONFIG_FILE['path_regex'], secret))  # must be an absolute path
+
+
+def _read_config_file(path: str):
+    """Returns the parsed file and its modification time"""
+    if not path.endswith('.yaml'):
+        raise ConfigError("Invalid GORRABOT_CONFIG_FILE: It must be a .yaml file")
+    try:
+        with open(path, 'r') as stream:
+            return load_yaml(stream), os.fstat(stream.fileno()).st_mtime_ns
+    except FileNotFoundError:
+        raise ConfigError("File not found")
+
+
+def _config_source() -> str:
+    source = GORRABOT_CONFIG_FILE['path']
+    if not source:
+        raise ConfigError("Invalid secret: Be sure you've set either CONFIG_SECRET_NAME or GORRABOT_CONFIG_FILE")
+    return source
+
+
+def get_config_version(current=None):
+    """Cheap check of the version of the config source: the Vault secret
+    version, or the modification time of the config file.
+
+    When the Vault secret is the path of a file, the version of the loaded
+    config, current, tells the file whose modification time is checked
+    """
+    try:
+        if 'config' in SECRETS:
+            version = get_secret_version()
+            if isinstance(current, tuple) and current[0] == version:
+                path = current[1]
+                return version, path, os.stat(path).st_mtime_ns
+            return version
+        source = _config_source()
+        return os.stat(source).st_mtime_ns if _is_path(source) else source
+    except (VaultError, OSError) as e:
+        raise ConfigError(e)
+
+
+def validate_config(new_config):
+    if not isinstance(new_config, dict):
+        raise ConfigError("The config must be a mapping")
+    for section in ('gitlab', 'projects'):
+        if not isinstance(new_config.get(section), dict):
+            raise ConfigError(f"The config must have a '{section}' mapping")
 
-    if re.match(GORRABOT_CONFIG_FILE['path_regex'], secret):  # must be an absolute path
-        if not secret.endswith('.yaml'):
-            print("Invalid GORRABOT_CONFIG_FILE: It must be a .yaml file")
-            exit(1)
 
+def load_config():
+    """Read, parse, validate and compile the config. Returns the raw config,
+    the compiled one and its version
+
+    :raises ConfigError: if the config can't be loaded or is invalid
+    """
+    if 'config' in SECRETS:
         try:
-            with open(secret, 'r') as stream:
-                return load_yaml(stream)
-        except FileNotFoundError:
-            print("File not found")
-            exit(1)
+            secret, version = get_secret_with_version(SECRETS['config'])
+        except VaultError as e:
+            raise ConfigError(e)
+        if not secret:
+            raise ConfigError("Invalid secret: Be sure you've set either CONFIG_SECRET_NAME or GORRABOT_CONFIG_FILE")
+        if _is_path(secret):
+            # The file can change without a new secret version
+            new_config, mtime = _read_config_file(secret)
+            version = (version, secret, mtime)
+        else:
+            new_config = load_yaml(secret)
+    else:
+        source = _config_source()
+        if _is_path(source):
+            new_config, version = _read_config_file(source)
+        else:
+            new_config, version = load_yaml(source), source
+
+    validate_config(new_config)
+    try:
+        compiled = compile_config(new_config)
+    except ValueError as e:
+        raise ConfigError(e)
+    return new_config, compiled, version
+
+
+# (raw config, compiled config, version), replaced as a whole so readers
+# never see a raw config and a compiled one that don't match
+_current = None
+_load_lock = threading.Lock()
+
+
+def _current_config():
+    if _current is None:
+        with _load_lock:
+            if _current is None:
+                try:
+                    _set_config(*load_config())
+                except ConfigError as e:
+                    print(e)
+                    exit(1)
+    return _current
 
-    return load_yaml(secret)
+
+def config() -> dict:
+    """Current config. It's loaded on the first call, and then only
+    replaced by refresh_config once a new valid config is ready"""
+    return _current_config()[0]
+
+
+def compiled_config() -> CompiledConfig:
+    """Compiled version of config(), see gorrabot.project_config"""
+    return _current_config()[1]
 
 
-config()
+def _set_config(new_config: dict, compiled: CompiledConfig, version):
+    global _current
+    _current = (new_config, compiled, version)
+
+
+def refresh_config(force=False) -> bool:
+    """Load the config again if its source changed, and swap it in if it's
+    valid. On errors the current config is kept. Returns whether the
+    config was replaced"""
+    with _load_lock:
+        try:
+            if not force and _current is not None and get_config_version(_current[2]) == _current[2]:
+                return False
+            new_config, compiled, version = load_config()
+        except ConfigError as e:
+            logger.error(f"Could not reload the config, keeping the current one: {e}")
+            return False
+        _set_config(new_config, compiled, version)
+    logger.info(f"Config reloaded, version {version}")
+    return True
@@ -1,12 +1,4 @@
-import datetime
 import re
-from collections import defaultdict
-
-from gorrabot.config import config
-
-BACKLOG_MILESTONE = config()['gitlab'].get('BACKLOG_MILESTONE', [])
-
-OLD_MEMBERS = config()['gitlab'].get('OLD_MEMBERS', [])
 
 MSG_MISSING_CHANGELOG = (
     'Si que te aprueben un merge request tu quieres, tocar el changelog tu '
@@ -86,23 +78,3 @@ MSG_NOTIFICATION_PREFIX_WITHOUT_USER = "{user} (No lo encontre en mi DB) commite
                                        ", pero esa rama:"
 MSG_BACKLOG_MILESTONE = "Tiene Backlog como milestone!"
 CHANGELOG_PREFIX = re.compile("^(\[(ADD|FIX|MOD|DEL)\])")
-
-# Define inactivity as a merge request whose last commit is older than
-# now() - inactivity_time
-inactivity_time = datetime.timedelta(days=config()['gitlab'].get('inactivity_time', 30))
-
-# Time to wait until a new message indicating the MR is stale is created
-stale_mr_message_interval = datetime.timedelta(days=config()['gitlab'].get('stale_mr_message_interval', 7))
-
-# Time to wait until a new message indicating the MR is stale is created
-decision_issue_message_interval = datetime.timedelta(days=config()['gitlab'].get('decision_issue_message_interval', 0))
-
-
-__other_regex = {
-    project_name: config()['projects'][project_name]['regex']
-    for project_name in config()['projects']
-    if 'regex' in config()['projects'][project_name]
-}
-# iid must be with this format: "P<iid>\d+"
-regex_dict = defaultdict(lambda: r'^(?:tkt|mig|sup|exp)_(?P<iid>\d+|y2k)[-_].+', __other_regex)
-
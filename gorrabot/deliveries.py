@@ -0,0 +1,52 @@
+"""Drop webhook deliveries that were already received.
+
+GitLab retries a delivery when the response takes too long, with the same
+X-Gitlab-Event-UUID header. Each delivery id is remembered for
+DELIVERY_TTL seconds, in the event journal when there is one so every
+process sees it, or in memory otherwise.
+"""
+import hashlib
+import json
+
+from gorrabot.persistent_queue import EventStore
+from gorrabot.ttl_cache import TTLCache
+from gorrabot.worker_factory import buffer
+
+# Seconds a delivery id is remembered. GitLab gives up retrying long before
+DELIVERY_TTL = 60 * 60
+
+# Delivery ids remembered in memory when there isn't an event journal
+MAX_DELIVERIES = 10000
+
+
+def delivery_id(headers, event: dict) -> str:
+    """Id of the delivery, or a hash of the payload for GitLab versions
+    that don't send one"""
+    uuid = headers.get('X-Gitlab-Event-UUID')
+    if uuid:
+        return uuid
+    payload = json.dumps(event, sort_keys=True, separators=(',', ':'))
+    return 'sha1:' + hashlib.sha1(payload.encode()).hexdigest()
+
+
+class DeliveryLog:
+
+    def __init__(self, store: EventStore = None):
+        self.store = store
+        self._seen = TTLCache(maxsize=MAX_DELIVERIES, ttl=DELIVERY_TTL)
+
+    def add(self, delivery_id: str) -> bool:
+        """Record the delivery, return False if it's a duplicate"""
+        if self.store is not None:
+            return self.store.add_delivery(delivery_id, DELIVERY_TTL)
+        return self._seen.add(delivery_id)
+
+    def remove(self, delivery_id: str):
+        """Forget the delivery, so a retry is accepted"""
+        if self.store is not None:
+            self.store.remove_delivery(delivery_id)
+        else:
+            self._seen.pop(delivery_id)
+
+
+deliveries = DeliveryLog(buffer.store)
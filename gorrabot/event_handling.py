@@ -4,14 +4,17 @@ from typing import NoReturn, List
 import re
 import logging
 
-from gorrabot.api.constants import gitlab_to_slack_user_dict
+from gorrabot.api.constants import gitlab_to_slack_user
 from gorrabot.api.gitlab import (
     GitlabLabels,
-    GITLAB_API_PREFIX
+    gitlab_api_prefix
 )
-from gorrabot.api.gitlab.issues import get_issue, update_issue
+from gorrabot.api.gitlab.issues import get_issue, update_issue_labels, flush_issue_updates
+from gorrabot.api.gitlab.request_cache import event_scope
 from gorrabot.api.gitlab.merge_requests import (
     set_wip,
+    webhook_draft_state,
+    flush_mr_updates,
     get_mr_changes,
     update_mr,
     comment_mr
@@ -19,16 +22,17 @@ from gorrabot.api.gitlab.merge_requests import (
 from gorrabot.api.gitlab.usernames import get_username
 from gorrabot.api.gitlab.utils import paginated_get
 from gorrabot.api.slack.messages import send_message_to_error_channel, send_debug_message
-from gorrabot.config import config
+from gorrabot.config import compiled_config
+from gorrabot.metrics import event_handling_seconds
+from gorrabot.telemetry import operation
 from gorrabot.constants import (
     NO_VALID_CHANGELOG_FILETYPE,
     MSG_BAD_BRANCH_NAME,
     MSG_MISSING_CHANGELOG,
     MSG_TKT_MR,
-    regex_dict, MSG_WITHOUT_PRIORITY, MSG_WITHOUT_SEVERITY, MSG_WITHOUT_WEIGHT, MSG_NOTIFICATION_PREFIX_WITH_USER,
+    MSG_WITHOUT_PRIORITY, MSG_WITHOUT_SEVERITY, MSG_WITHOUT_WEIGHT, MSG_NOTIFICATION_PREFIX_WITH_USER,
     MSG_NOTIFICATION_PREFIX_WITHOUT_USER,
     MSG_WITHOUT_MILESTONE,
-    BACKLOG_MILESTONE,
     MSG_BACKLOG_MILESTONE,
     MSG_WITHOUT_ITERATION,
     CHANGELOG_PREFIX,
@@ -48,6 +52,20 @@ logger = logging.getLogger(__name__)
 
 
 def handle_event(event):
+    # All the checks for an event share the same GitLab reads
+    kind = event.get('object_kind')
+    with event_scope(), operation(f'event:{kind}'), event_handling_seconds.time(kind=kind):
+        try:
+            _handle_event(event)
+        finally:
+            # Changes to a MR or issue are sent in a single request, also
+            # when a later check failed. A failed update is logged by the
+            # flush, it isn't raised so the handler doesn't run again
+            flush_mr_updates()
+            flush_issue_updates()
+
+
+def _handle_event(event):
     if event.get('object_kind') == 'push':
         logger.info("Handling a PUSH event")
         send_debug_message("Handling a PUSH event")
@@ -73,7 +91,8 @@ def handle_push(push: dict) -> str:
     project_name = push["repository"]["name"]
     branch_name = push['ref'][len(prefix):]
     logger.info(f'Handling push from {project_name}, branch {branch_name}')
-    if project_name not in config()['projects']:
+    project = compiled_config().projects.get(project_name)
+    if project is None:
         message = f"The project `{project_name}` tried to use gorrabot's webhook, but its not in the configuration"
         send_message_to_error_channel(
             text=message,
@@ -83,17 +102,14 @@ def handle_push(push: dict) -> str:
         logger.info(message)
         return
 
-    branch_regex = regex_dict[project_name]
-
-    if not re.match(branch_regex, branch_name):
-        regex_branch_exceptions = config()['projects'][project_name].get('regex_branch_exceptions', [])
+    if not project.branch_regex.match(branch_name):
         if not re.match(r"^((dev|master|staging)|(.*/(dev|master|staging)))$", branch_name) \
-                and branch_name not in regex_branch_exceptions:
+                and branch_name not in project.regex_branch_exceptions:
             logger.warning("Branch does not match with regex")
             send_debug_message("Branch does not match with regex")
             send_message_to_error_channel(f"Unexpected push to `{project_name}`, branch `{branch_name}` do not follow "
                                           "expected regex format",
-                                          project_id=config()['projects'][project_name]['id'])
+                                          project_id=project.id)
         else:
             logger.info("dev, master or staging branch")
             send_debug_message("dev, master or staging branch")
@@ -108,7 +124,7 @@ def handle_push(push: dict) -> str:
         return message
     else:
         check_required_attributes(push, branch_name)
-        if 'multi-branch' in config()['projects'][project_name]:
+        if project.is_multi_branch:
             return handle_multi_main_push(push, prefix)
 
     return 'OK'
@@ -123,8 +139,9 @@ def handle_mr(mr_json: dict) -> str:
     mr_attributes = mr_json['object_attributes']
     project_name = mr_json["repository"]["name"]
     source_branch = mr_attributes.get("source_branch")
+    project = compiled_config().projects.get(project_name)
 
-    if project_name not in config()['projects']:
+    if project is None:
         logger.warning('Project not in the configuration')
         send_debug_message('Project not in the configuration')
         send_message_to_error_channel(
@@ -137,8 +154,6 @@ def handle_mr(mr_json: dict) -> str:
     username = get_username(mr_json)
     (project_id, iid) = (mr_attributes['source_project_id'], mr_attributes['iid'])
 
-    branch_regex = regex_dict[project_name]
-    regex_branch_exceptions = config()['projects'][project_name].get('regex_branch_exceptions', [])
     logger.info(f"Handling MR #{iid} from branch {source_branch} of project {project_name}")
     if 'y2k' in str(iid):
         message = f'Ignoring MR from branch {source_branch} because is y2k'
@@ -149,11 +164,11 @@ def handle_mr(mr_json: dict) -> str:
         )
         logger.info(message)
         return message
-    if not re.match(branch_regex, source_branch) \
-       and source_branch not in regex_branch_exceptions:
+    if not project.branch_regex.match(source_branch) \
+       and source_branch not in project.regex_branch_exceptions:
         logger.info(f"Branch {source_branch} of repository {project_name} do not match regex")
         send_debug_message(f"Branch {source_branch} of repository {project_name} do not match regex")
-        multi_branch = config()['projects'][project_name].get('multi-branch', '')
+        multi_branch = project.multi_branch or ''
         msg_bad_branch_name = MSG_BAD_BRANCH_NAME.format(main_branches=multi_branch)
         comment_mr(project_id, iid, f"@{username}: {msg_bad_branch_name}", can_be_duplicated=False)
     is_multi_main = is_multi_main_mr(mr_json)
@@ -196,9 +211,10 @@ def check_status(mr_json: dict, project_name: str) -> NoReturn:
     mr_attributes = mr_json['object_attributes']
     (project_id, iid) = (mr_attributes['source_project_id'], mr_attributes['iid'])
     username = get_username(mr_json)
+    # Taken before the checks change mr_attributes
+    draft_state = webhook_draft_state(mr_attributes)
 
-    changelog_filetype = config()['projects'][project_name]['changelog_filetype'] \
-                         if 'changelog_filetype' in config()['projects'][project_name] else '.md'
+    changelog_filetype = compiled_config().projects[project_name].changelog_filetype
     logger.info("Checking changelog")
     if not has_changed_changelog(project_id, iid, project_name, only_md=True):
         logger.info("The MR doesn't have changelog or is a bad file type")
@@ -208,25 +224,23 @@ def check_status(mr_json: dict, project_name: str) -> NoReturn:
         else:
             msg = MSG_MISSING_CHANGELOG
         comment_mr(project_id, iid, f"@{username}: {msg}")
-        set_wip(project_id, iid)
+        set_wip(project_id, iid, draft_state)
         mr_attributes['work_in_progress'] = True
     else:
-        check_changelog_format(project_id, iid, project_name, username, issue_id, mr_attributes)
+        check_changelog_format(project_id, iid, project_name, username, issue_id, mr_attributes, draft_state)
 
 
-def check_changelog_format(project_id, iid, project_name, username, issue_id, mr_attributes):
+def check_changelog_format(project_id, iid, project_name, username, issue_id, mr_attributes, draft_state=None):
     changes = get_mr_changes(project_id, iid)
+    ext = compiled_config().projects[project_name].changelog_filetype
     for file in changes:
         if file['new_path'].startswith('CHANGELOG'):
-            ext = config()['projects'][project_name]['changelog_filetype'] \
-                        if 'changelog_filetype' in config()['projects'][project_name] \
-                        else '.md'
             # If the file exist but is empty don't do anything
             try:
                 if len(file["diff"]) == 0:
                     logger.info(f"Changelog Empty")
                     comment_mr(project_id, iid, f"@{username}: {MSG_CHANGELOG_EMPTY}")
-                    set_wip(project_id, iid)
+                    set_wip(project_id, iid, draft_state)
                     return
                 if ext == ".json":
                     md = json.loads(file["diff"].split("@\n")[1].replace("+", "").replace("\n", ""))['md']
@@ -244,7 +258,7 @@ def check_changelog_format(project_id, iid, project_name, username, issue_id, mr
                     mr_attributes['work_in_progress'] = True
                     msg = '\n\n'.join(msg)
                     comment_mr(project_id, iid, f"@{username}: \n\n {msg}")
-                    set_wip(project_id, iid)
+                    set_wip(project_id, iid, draft_state)
 
             except Exception as ex:
                 logger.info(ex)
@@ -260,7 +274,7 @@ def get_iteration(push: dict, branch_name: str) -> dict:
     project_id = push_info['project_id']
     issue_iid = push_info['issue_iid']
 
-    url = f'{GITLAB_API_PREFIX}/projects/{project_id}/issues/{issue_iid}/resource_iteration_events'
+    url = f'{gitlab_api_prefix()}/projects/{project_id}/issues/{issue_iid}/resource_iteration_events'
     iteration_info = paginated_get(url)
 
     # In order to get the last-used iteration, the list is reversed.
@@ -312,7 +326,7 @@ def check_required_attributes(push: dict, branch_name: str) -> NoReturn:
         logger.info("Milestone not found")
         messages.append(MSG_WITHOUT_MILESTONE)
     else:
-        if milestone['title'] in BACKLOG_MILESTONE:
+        if milestone['title'] in compiled_config().gitlab.backlog_milestone:
             logger.info("Backlog detected as milestone")
             messages.append(MSG_BACKLOG_MILESTONE)
 
@@ -324,9 +338,10 @@ def check_required_attributes(push: dict, branch_name: str) -> NoReturn:
     if len(messages) > 0:
         error_message_list = '\n    * '.join([''] + messages)
         username = push["user_username"]
-        if username in gitlab_to_slack_user_dict:
+        slack_user = gitlab_to_slack_user(username)
+        if slack_user is not None:
             error_message = MSG_NOTIFICATION_PREFIX_WITH_USER.format(
-                user=gitlab_to_slack_user_dict[username],
+                user=slack_user,
                 branch=branch_name,
                 project_name=project_name
             )
@@ -337,25 +352,22 @@ def check_required_attributes(push: dict, branch_name: str) -> NoReturn:
                                                                         )
 
         error_message = f"{error_message}{error_message_list}"
-        send_message_to_error_channel(error_message, project_id=config()['projects'][project_name]['id'])
+        send_message_to_error_channel(error_message, project_id=compiled_config().projects[project_name].id)
 
 
 # @ehorvat: I believe this should be in a utils as it depends on gitlab
 def has_changed_changelog(project_id: int, iid: int, project_name, only_md: bool):
     changes = get_mr_changes(project_id, iid)
     changed_files = get_changed_files(changes)
+    project = compiled_config().projects[project_name]
     for filename in changed_files:
         if filename.startswith('CHANGELOG'):
-            valid_ext = config()['projects'][project_name]['changelog_filetype'] \
-                        if 'changelog_filetype' in config()['projects'][project_name] \
-                        else '.md'
-            if not only_md or filename.endswith(valid_ext):
+            if not only_md or filename.endswith(project.changelog_filetype):
                 return True
             else:
-                if 'changelog_exceptions' in config()['projects'][project_name]:
-                    _, file_name = os.path.split(filename)
-                    if file_name in config()['projects'][project_name]['changelog_exceptions']:
-                        return True
+                _, file_name = os.path.split(filename)
+                if file_name in project.changelog_exceptions:
+                    return True
 
     return False
 
@@ -381,38 +393,27 @@ def sync_related_issue(mr_json: dict):
     mr = mr_json["object_attributes"]
     issue_iid = get_related_issue_iid(mr_json)
     project_id = mr['source_project_id']
-    if issue_iid is None:
-        return
-    issue = get_issue(project_id, issue_iid)
-    if issue is None or has_label(mr_json, GitlabLabels.MULTIPLE_MR):
+    if issue_iid is None or has_label(mr_json, GitlabLabels.MULTIPLE_MR):
         return
 
-    close = False
-    new_labels = issue['labels']
-    try:
-        new_labels.remove(GitlabLabels.TEST)
-    except ValueError:
-        pass
-    try:
-        new_labels.remove(GitlabLabels.ACCEPTED)
-    except ValueError:
-        pass
-
+    # Only the status labels change, so the issue doesn't need to be read
+    new_labels = set()
+    state_event = None
     if mr['work_in_progress']:
-        new_labels.append(GitlabLabels.ACCEPTED)
+        new_labels.add(GitlabLabels.ACCEPTED)
     elif mr['state'] == 'opened':
-        new_labels.append(GitlabLabels.TEST)
+        new_labels.add(GitlabLabels.TEST)
     elif mr['state'] == 'merged':
-        close = True
+        state_event = 'close'
     elif mr['state'] == 'closed':
         pass
 
-    new_labels = list(set(new_labels))
-    data = {"labels": ','.join(new_labels)}
-    if close:
-        data['state_event'] = 'close'
-
-    return update_issue(project_id, issue_iid, data)
+    return update_issue_labels(
+        project_id, issue_iid,
+        add=new_labels,
+        remove={GitlabLabels.TEST, GitlabLabels.ACCEPTED},
+        state_event=state_event,
+    )
 
 
 def check_issue_reference_in_description(mr_json: dict):
@@ -429,4 +430,4 @@ def check_issue_reference_in_description(mr_json: dict):
 
 
 def is_multi_main_mr(mr_json):
-    return 'multi-branch' in config()['projects'][mr_json["repository"]["name"]]
+    return compiled_config().projects[mr_json["repository"]["name"]].is_multi_branch
@@ -0,0 +1,201 @@
+"""Operational metrics, served in the Prometheus text format by /metrics,
+which requires the GitLab webhook token as a bearer token.
+
+Metrics are kept in memory, so with several web processes each one
+reports its own.
+"""
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+from gorrabot.telemetry import current_operation, current_operation_name
+
+# Seconds
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self):
+        pass
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    """Gauge that is set, or whose value is read from function when it's
+    rendered"""
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float] = None):
+        super().__init__(name, documentation)
+        self.function = function
+        self._value = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def samples(self):
+        value = self.function() if self.function is not None else self._value
+        if value is not None:
+            yield f'{self.name} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count of each bucket, sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = [counts, total + value, count + 1]
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f'{self.name}_bucket{labels} {bucket_count}'
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f'{self.name}_bucket{labels} {count}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {count}'
+
+
+registry = []
+
+
+def render() -> str:
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+event_handling_seconds = Histogram(
+    'gorrabot_event_handling_seconds', 'Time spent handling a webhook event', ('kind',)
+)
+failed_events = Counter('gorrabot_failed_events_total', 'Events whose handling raised an error', ('kind',))
+# operation is the event kind or cron job that made the request, see
+# gorrabot.telemetry
+http_requests = Counter(
+    'gorrabot_http_requests_total', 'Requests made to GitLab and Slack',
+    ('service', 'method', 'endpoint', 'status', 'operation')
+)
+http_request_seconds = Histogram(
+    'gorrabot_http_request_seconds', 'Latency of the requests made to GitLab and Slack',
+    ('service', 'method', 'endpoint', 'operation')
+)
+http_response_bytes = Counter(
+    'gorrabot_http_response_bytes_total', 'Bytes received from GitLab and Slack',
+    ('service', 'method', 'endpoint', 'operation')
+)
+gitlab_rate_limit_remaining = Gauge(
+    'gorrabot_gitlab_rate_limit_remaining', 'Requests left in the current GitLab rate limit window'
+)
+gitlab_rate_limit_limit = Gauge(
+    'gorrabot_gitlab_rate_limit_limit', 'Requests allowed in each GitLab rate limit window'
+)
+
+
+def endpoint_template(path: str) -> str:
+    """Replace ids, commit shas and branch names in an API path so every
+    request to the same endpoint shares the labels"""
+    segments = path.split('/')
+    for i, segment in enumerate(segments):
+        if i > 0 and segments[i - 1] == 'branches':
+            segments[i] = ':branch'
+        elif segment.isdigit() or re.fullmatch(r'[0-9a-f]{40}', segment):
+            segments[i] = ':id'
+    return '/'.join(segments)
+
+
+def instrument_session(session, service: str):
+    """Count, time and measure every request made with a requests session,
+    and record GitLab rate limit headers"""
+    def record(response, *args, **kwargs):
+        labels = {
+            'service': service,
+            'method': response.request.method,
+            'endpoint': endpoint_template(response.request.path_url.split('?', 1)[0]),
+            'operation': current_operation_name(),
+        }
+        seconds = response.elapsed.total_seconds()
+        size = len(response.content)
+        http_requests.inc(status=response.status_code, **labels)
+        http_request_seconds.observe(seconds, **labels)
+        http_response_bytes.inc(size, **labels)
+        stats = current_operation()
+        if stats is not None:
+            stats.record(service, seconds, size)
+        if service == 'gitlab' and 'RateLimit-Remaining' in response.headers:
+            gitlab_rate_limit_remaining.set(int(response.headers['RateLimit-Remaining']))
+            gitlab_rate_limit_limit.set(int(response.headers.get('RateLimit-Limit', 0)))
+    session.hooks['response'].append(record)
@@ -1,9 +1,8 @@
 from logging import getLogger
 from typing import List
-import re
 
 from gorrabot.api.gitlab import GitlabLabels
-from gorrabot.api.gitlab.issues import get_issue, update_issue
+from gorrabot.api.gitlab.issues import update_issue_labels
 from gorrabot.api.gitlab.merge_requests import (
     get_merge_requests,
     comment_mr,
@@ -13,8 +12,8 @@ from gorrabot.api.gitlab.merge_requests import (
 )
 from gorrabot.api.gitlab.usernames import get_username
 from gorrabot.api.slack.messages import send_debug_message
-from gorrabot.config import config
-from gorrabot.constants import MSG_NEW_MR_CREATED, MSG_CHECK_SUPERIOR_MR, regex_dict
+from gorrabot.config import compiled_config
+from gorrabot.constants import MSG_NEW_MR_CREATED, MSG_CHECK_SUPERIOR_MR
 from gorrabot.utils import get_related_issue_iid, fill_fields_based_on_issue, has_label
 
 
@@ -26,8 +25,9 @@ def get_previous_or_next(project_name: str, branch_name: str, previous: bool) ->
     This will get the branch (e.g. tkt_previous_XXXX_extra), and check if the previous branches MR exists
     (e.g. tkt_previous_XXXX_extra; not tkt_next_XXXX_extra)
     """
-    parent_branches: List[str] = config()['projects'][project_name]['multi-branch']
-    main_branch = re.match(regex_dict[project_name], branch_name).group('base')
+    project = compiled_config().projects[project_name]
+    parent_branches: List[str] = project.multi_branch
+    main_branch = project.branch_regex.match(branch_name).group('base')
     if previous:
         others_parent_main_branches = parent_branches[:parent_branches.index(main_branch)]
     else:
@@ -116,7 +116,9 @@ def ensure_upper_version_is_created(push: dict, branch_name: str, previous_branc
     new_mr = create_mr(previous_mr['source_project_id'], mr_data)
     fill_fields_based_on_issue(new_mr)
     username = get_username(previous_mr)
-    msg_new_mr_created = MSG_NEW_MR_CREATED.format(base_branch=config()['projects'][project_name]['multi-branch'][0])
+    msg_new_mr_created = MSG_NEW_MR_CREATED.format(
+        base_branch=compiled_config().projects[project_name].multi_branch[0]
+    )
     return comment_mr(
         project_id,
         new_mr['iid'],
@@ -125,7 +127,7 @@ def ensure_upper_version_is_created(push: dict, branch_name: str, previous_branc
 
 
 def create_similar_mr(parent_mr: dict, project_name: str, branch_name: str) -> dict:
-    main_branch = re.match(regex_dict[project_name], branch_name).group('base')
+    main_branch = compiled_config().projects[project_name].branch_regex.match(branch_name).group('base')
     target_branch = f"{main_branch}/dev"
     new_title = (
         f"{parent_mr['title']} ({main_branch} edition)"
@@ -181,9 +183,10 @@ def notify_unmerged_superior_mrs(mr_json: dict, project_name: str):
     mr = get_mr(project_id, mr['iid'])
 
     username = mr['merged_by']['username']
+    multi_branch = compiled_config().projects[project_name].multi_branch
     msg_check_superior = MSG_CHECK_SUPERIOR_MR.format(
-        prev_main_branches=f"({','.join(config()['projects'][project_name]['multi-branch'][:-1])})",
-        main_branches=[f"{branch}/dev" for branch in config()['projects'][project_name]['multi-branch']]
+        prev_main_branches=f"({','.join(multi_branch[:-1])})",
+        main_branches=[f"{branch}/dev" for branch in multi_branch]
     )
     for rmr in related_mrs:
         comment_mr(
@@ -219,12 +222,5 @@ def add_multiple_merge_requests_label_if_needed(mr_json: dict):
     assert any(rmr['iid'] == mr['iid']
                for rmr in related_mrs)
 
-    if len(related_mrs) > 1:
-        issue = get_issue(project_id, issue_iid)
-        if issue is None or has_label(mr_json, GitlabLabels.MULTIPLE_MR):
-            return
-        new_labels = issue['labels']
-        new_labels.append(GitlabLabels.MULTIPLE_MR)
-        new_labels = list(set(new_labels))
-        data = {"labels": ','.join(new_labels)}
-        return update_issue(project_id, issue_iid, data)
+    if len(related_mrs) > 1 and not has_label(mr_json, GitlabLabels.MULTIPLE_MR):
+        return update_issue_labels(project_id, issue_iid, add={GitlabLabels.MULTIPLE_MR})
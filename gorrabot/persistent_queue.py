@@ -0,0 +1,132 @@
+"""SQLite journal that makes the event buffer survive restarts.
+
+Every accepted event is written to the journal before being queued, and
+removed from it once the handler finishes without errors. On startup,
+events left by a process that is no longer running are claimed and queued
+again, so delivery is at-least-once.
+
+It also records the ids of the received webhook deliveries, so retries
+are recognized by every process that shares the file.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Events that fail this number of times are dropped
+MAX_ATTEMPTS = 3
+
+# Events older than this number of seconds aren't replayed, the data they
+# carry is probably outdated
+MAX_REPLAY_AGE = 24 * 60 * 60
+
+
+def _is_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        # This process is just starting, so a row with its pid was left by
+        # a previous process that had the same pid (e.g. in a new container)
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class EventStore:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' payload TEXT NOT NULL,'
+            ' owner INTEGER NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' created_at REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS deliveries ('
+            ' id TEXT PRIMARY KEY,'
+            ' received_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS deliveries_received_at ON deliveries (received_at)')
+
+    def add(self, event: dict) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO events (payload, owner, created_at) VALUES (?, ?, ?)',
+                (json.dumps(event), os.getpid(), time.time())
+            )
+            return cursor.lastrowid
+
+    def ack(self, event_id: int):
+        with self._lock:
+            self._conn.execute('DELETE FROM events WHERE id = ?', (event_id,))
+
+    def fail(self, event_id: int) -> bool:
+        """Count a failed attempt, return whether the event was dropped
+        because it reached MAX_ATTEMPTS"""
+        with self._lock:
+            self._conn.execute('UPDATE events SET attempts = attempts + 1 WHERE id = ?', (event_id,))
+            cursor = self._conn.execute(
+                'DELETE FROM events WHERE id = ? AND attempts >= ?', (event_id, MAX_ATTEMPTS)
+            )
+            return cursor.rowcount > 0
+
+    def add_delivery(self, delivery_id: str, ttl: float) -> bool:
+        """Record a webhook delivery, return False if it was already recorded
+        in the last ttl seconds"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('DELETE FROM deliveries WHERE received_at < ?', (now - ttl,))
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO deliveries (id, received_at) VALUES (?, ?)', (delivery_id, now)
+            )
+            return cursor.rowcount == 1
+
+    def remove_delivery(self, delivery_id: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM deliveries WHERE id = ?', (delivery_id,))
+
+    def claim_orphans(self):
+        """Take ownership of the events of dead processes and return them
+        in the order they were accepted"""
+        pid = os.getpid()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'DELETE FROM events WHERE created_at < ? OR attempts >= ?',
+                    (time.time() - MAX_REPLAY_AGE, MAX_ATTEMPTS)
+                )
+                rows = self._conn.execute(
+                    'SELECT id, payload, owner FROM events ORDER BY id'
+                ).fetchall()
+                dead_owners = {owner for owner in {row[2] for row in rows} if not _is_alive(owner)}
+                orphans = [(event_id, json.loads(payload))
+                           for event_id, payload, owner in rows if owner in dead_owners]
+                self._conn.executemany(
+                    'UPDATE events SET owner = ? WHERE id = ?',
+                    [(pid, event_id) for event_id, _ in orphans]
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return orphans
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
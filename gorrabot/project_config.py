@@ -0,0 +1,97 @@
+"""Typed view of the config, built once every time the config is loaded.
+
+Hot paths use it instead of indexing the raw YAML dict: regexes are
+already compiled, flags and exceptions are sets, and projects can be
+looked up both by name and by id.
+"""
+import datetime
+import re
+from typing import Dict, FrozenSet, List, Optional, Pattern
+
+# iid must be with this format: "P<iid>\d+"
+DEFAULT_BRANCH_REGEX = re.compile(r'^(?:tkt|mig|sup|exp)_(?P<iid>\d+|y2k)[-_].+')
+
+DEFAULT_CHANGELOG_FILETYPE = '.md'
+
+DEFAULT_LABELS = {
+    'DONT_RUSH_ME': 'Do not rush me',
+    'NO_CHANGELOG': 'No changelog',
+    'DONT_TRACK': 'Do not track',
+    'MULTIPLE_MR': 'Multiple MR',
+    'TEST': 'Test',
+    'ACCEPTED': 'Accepted',
+}
+
+
+class ProjectConfig:
+    """Settings of a single project of the config"""
+
+    def __init__(self, name: str, data: dict):
+        self.name: str = name
+        self.raw: dict = data
+        self.id: Optional[int] = int(data['id']) if 'id' in data else None
+        self.branch_regex: Pattern = re.compile(data['regex']) if 'regex' in data else DEFAULT_BRANCH_REGEX
+        self.has_flags: bool = 'flags' in data
+        self.flags: FrozenSet[str] = frozenset(flag.upper() for flag in data.get('flags') or [])
+        self.changelog_filetype: str = data.get('changelog_filetype', DEFAULT_CHANGELOG_FILETYPE)
+        self.changelog_exceptions: FrozenSet[str] = frozenset(data.get('changelog_exceptions') or [])
+        self.regex_branch_exceptions: FrozenSet[str] = frozenset(data.get('regex_branch_exceptions') or [])
+        self.multi_branch: Optional[List[str]] = data.get('multi-branch')
+        self.comment_mr = data.get('comment_mr', True)
+        self.send_message_to_slack = data.get('send_message_to_slack', True)
+
+    @property
+    def is_multi_branch(self) -> bool:
+        return self.multi_branch is not None
+
+
+class GitlabSettings:
+    """Settings of the 'gitlab' section of the config"""
+
+    def __init__(self, data: dict):
+        labels = data.get('labels') or {}
+        self.labels: Dict[str, str] = {key: labels.get(key, default) for key, default in DEFAULT_LABELS.items()}
+        self.backlog_milestone: List[str] = data.get('BACKLOG_MILESTONE', [])
+        self.old_members: FrozenSet[str] = frozenset(data.get('OLD_MEMBERS') or [])
+        self.report_users: List[str] = data.get('REPORT_USERS', [])
+        self.max_issues_accepted: int = int(data.get('MAX_ISSUES_ACCEPTED', 2))
+        self.gitlab_to_slack_user_dict: Dict[str, str] = data.get('gitlab_to_slack_user_dict') or {}
+        self.slack_to_gitlab_user_dict: Dict[str, str] = {
+            value: key for key, value in self.gitlab_to_slack_user_dict.items()
+        }
+        # Define inactivity as a merge request whose last commit is older than
+        # now() - inactivity_time
+        self.inactivity_time = datetime.timedelta(days=data.get('inactivity_time', 30))
+        # Time to wait until a new message indicating the MR is stale is created
+        self.stale_mr_message_interval = datetime.timedelta(days=data.get('stale_mr_message_interval', 7))
+        # Time to wait until a new message indicating the issue is waiting a decision is created
+        self.decision_issue_message_interval = datetime.timedelta(
+            days=data.get('decision_issue_message_interval', 0)
+        )
+
+
+class CompiledConfig:
+
+    def __init__(self, data: dict):
+        self.gitlab = GitlabSettings(data['gitlab'])
+        self.projects: Dict[str, ProjectConfig] = {
+            name: ProjectConfig(name, project_data or {})
+            for name, project_data in data['projects'].items()
+        }
+        self.projects_by_id: Dict[int, ProjectConfig] = {
+            project.id: project for project in self.projects.values() if project.id is not None
+        }
+
+    def branch_regex(self, project_name: str) -> Pattern:
+        """Regex of the project, or the default one for projects that are not
+        configured"""
+        project = self.projects.get(project_name)
+        return project.branch_regex if project is not None else DEFAULT_BRANCH_REGEX
+
+
+def compile_config(data: dict) -> CompiledConfig:
+    """:raises ValueError: if some value of the config is invalid"""
+    try:
+        return CompiledConfig(data)
+    except (re.error, TypeError, AttributeError, KeyError) as e:
+        raise ValueError(f"{type(e).__name__}: {e}") from e
@@ -0,0 +1,92 @@
+"""Archive of the accepted webhooks, to replay real traffic in load tests.
+
+When GORRABOT_RECORD_DIR is set, every accepted webhook is appended, with
+its headers, to a gzipped JSONL file in that directory. Files are rotated
+when they reach GORRABOT_RECORD_MAX_MB of uncompressed data, and only the
+newest GORRABOT_RECORD_KEEP files are kept. benchmarks/replay_webhooks.py
+reads them back.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RECORD_DIR = os.environ.get('GORRABOT_RECORD_DIR')
+RECORD_MAX_BYTES = int(float(os.environ.get('GORRABOT_RECORD_MAX_MB', 100)) * 1024 * 1024)
+RECORD_KEEP = int(os.environ.get('GORRABOT_RECORD_KEEP', 20))
+
+# Only these headers are recorded, X-Gitlab-Token is a secret
+RECORDED_HEADERS = ('X-Gitlab-Event', 'X-Gitlab-Event-UUID', 'X-Gitlab-Instance', 'User-Agent')
+
+ARCHIVE_PATTERN = 'webhooks-*.jsonl.gz'
+
+
+def archive_files(directory: str):
+    """Archives of a directory, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, ARCHIVE_PATTERN)))
+
+
+def read_archive(path: str):
+    """Yield the records of an archive. The file may still be written, so
+    a truncated last line is ignored"""
+    with gzip.open(path, 'rt') as archive:
+        try:
+            for line in archive:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring truncated record in {path}")
+        except EOFError:
+            pass
+
+
+class WebhookRecorder:
+
+    def __init__(self, directory: str, max_bytes: int = RECORD_MAX_BYTES, keep: int = RECORD_KEEP):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._file = None
+        self._written = 0
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        # The pid keeps apart the files of different web processes
+        name = f"webhooks-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz"
+        self._file = gzip.open(os.path.join(self.directory, name), 'at')
+        self._written = 0
+        for path in archive_files(self.directory)[:-max(self.keep, 1)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Removed by another process
+                pass
+
+    def record(self, headers, event: dict):
+        line = json.dumps({
+            'received_at': time.time(),
+            'headers': {name: headers[name] for name in RECORDED_HEADERS if name in headers},
+            'event': event,
+        }) + '\n'
+        with self._lock:
+            try:
+                if self._file is None or self._written >= self.max_bytes:
+                    self._rotate()
+                self._file.write(line)
+                # Flush the compressor, so a crash loses at most this record
+                self._file.flush()
+                self._written += len(line)
+            except OSError:
+                # Recording must never make the webhook fail
+                logger.exception("Could not record webhook")
+
+
+recorder = WebhookRecorder(RECORD_DIR) if RECORD_DIR else None
@@ -5,14 +5,18 @@ import sys
 from flask import Flask, request, abort, make_response
 
 from gorrabot.api.gitlab import (
-    GITLAB_REQUEST_TOKEN,
-    GITLAB_SELF_USERNAME,
+    gitlab_request_token,
+    gitlab_self_username,
 )
-from gorrabot.worker_factory import buffer
+from gorrabot.coalescer import coalescer
+from gorrabot.deliveries import deliveries, delivery_id
+from gorrabot.metrics import render as render_metrics
+from gorrabot.recorder import recorder
 from gorrabot.api.slack.messages import send_debug_message
-from gorrabot.api.slack import SLACK_REQUEST_TOKEN
+from gorrabot.bootstrap import bootstrap
+from gorrabot.api.slack import slack_request_token
 from gorrabot.slack_commands import handle_summary
-from gorrabot.config import DEBUG_MODE, config
+from gorrabot.config import DEBUG_MODE, refresh_config
 
 
 app = Flask(__name__)
@@ -28,12 +32,26 @@ root.addHandler(handler)
 logger = logging.getLogger(__name__)
 
 
+def is_authorized_request():
+    """The request carries the GitLab webhook token, in X-Gitlab-Token or
+    as a bearer token, which is what Prometheus can send"""
+    if DEBUG_MODE:
+        return True
+    token = request.headers.get('X-Gitlab-Token')
+    if token is None:
+        authorization = request.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):]
+    return token == gitlab_request_token()
+
+
 @app.route('/clear-cache')
 def clear_vault_cache():
-    if not DEBUG_MODE and request.headers.get('X-Gitlab-Token') != GITLAB_REQUEST_TOKEN:
+    if not is_authorized_request():
         abort(403)
-    logger.info("Clearing Vault cache...")
-    config.cache_clear()
+    logger.info("Reloading config...")
+    if not refresh_config(force=True):
+        return make_response({"message": "Config could not be reloaded, check the logs"}, 500)
     return "OK"
 
 
@@ -42,12 +60,22 @@ def status():
     return "OK"
 
 
+@app.route('/metrics')
+def metrics():
+    # Metrics tell the GitLab endpoints used and the load of the bot
+    if not is_authorized_request():
+        abort(403)
+    response = make_response(render_metrics())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
 @app.route('/slack-commands', methods=['POST'])
 def summary():
     content = request.form
     command = content.get('command')
     logger.info(f"Handling Slack command {command}")
-    if not DEBUG_MODE and content.get('token') != SLACK_REQUEST_TOKEN:
+    if not DEBUG_MODE and content.get('token') != slack_request_token():
         logger.info(f"Command {command} Not allow")
         abort(403)
     if command == '/summary':
@@ -62,7 +90,7 @@ def summary():
 
 @app.route('/webhook', methods=['POST'])
 def homepage():
-    if not DEBUG_MODE and request.headers.get('X-Gitlab-Token') != GITLAB_REQUEST_TOKEN:
+    if not DEBUG_MODE and request.headers.get('X-Gitlab-Token') != gitlab_request_token():
         logger.info("Request unauthorized")
         abort(403)
     event_json = request.get_json()
@@ -70,18 +98,30 @@ def homepage():
         logger.info("Request doesn't have json")
         abort(200)
     logger.info("Event received")
-    if event_json.get('user',{}).get('username') == GITLAB_SELF_USERNAME:
+    if event_json.get('user',{}).get('username') == gitlab_self_username():
         # To prevent infinite loops and race conditions, ignore events related
         # to actions that this bot did
         message = 'Ignoring webhook from myself'
         logger.info(message)
         send_debug_message(message)
         abort(make_response({"message": message}, 200))
-    buffer.put(event_json)
+    event_delivery_id = delivery_id(request.headers, event_json)
+    if not deliveries.add(event_delivery_id):
+        logger.info(f"Ignoring duplicated delivery {event_delivery_id}")
+        return 'OK'
+    if recorder is not None:
+        recorder.record(request.headers, event_json)
+    try:
+        coalescer.put(event_json)
+    except Exception:
+        # Let GitLab retry it
+        deliveries.remove(event_delivery_id)
+        raise
     return 'OK'
 
 
 def main():
+    bootstrap()
     app.run()
 
 
@@ -1,6 +1,6 @@
 from flask import make_response
 
-from gorrabot.config import config
+from gorrabot.config import compiled_config
 from gorrabot.slack_resume import main
 
 
@@ -9,7 +9,7 @@ def handle_summary(content):
     project = content.get('text').strip()
     message = ''
     if project != '':
-        if any([accepted_project['id'] == project for accepted_project in config()['projects']]):
+        if any(str(accepted_project.id) == project for accepted_project in compiled_config().projects.values()):
             message = "Project found"
             main(user, project)
         else:
@@ -4,21 +4,19 @@ import os
 import sys
 from collections import defaultdict
 import logging
-import time
-from gorrabot.api.constants import gitlab_to_slack_user, MAX_ISSUES_ACCEPTED
+from gorrabot.api.constants import gitlab_to_slack_user
 from gorrabot.api.gitlab.issues import get_accepted_issues
 from gorrabot.api.gitlab.usernames import get_usernames_from_mr_or_issue
-from gorrabot.api.slack.messages import send_message_to_user, check_can_send_slack_messages
-from gorrabot.api.slack.users import get_slack_user_data
-from gorrabot.constants import OLD_MEMBERS
+from gorrabot.api.slack.dispatcher import SlackDispatcher
+from gorrabot.api.slack.messages import check_can_send_slack_messages
+from gorrabot.api.slack.users import get_slack_user_index
+from gorrabot.bootstrap import bootstrap
 from gorrabot.utils import get_decision_issues, get_waiting_users_from_issue, get_staled_merge_requests, create_report
-from gorrabot.config import config
+from gorrabot.config import compiled_config
+from gorrabot.telemetry import ContextThreadPoolExecutor, operation
 
 DRY_RUN = os.environ.get("DRY_RUN", None)
 
-REPORT_USERS = config()['gitlab'].get('REPORT_USERS', [])
-
-project_ids = [int(config()['projects'][project_name]['id']) for project_name in config()['projects']]
 
 """
 The idea of this script is identify who is blocking other dev and notify about this:
@@ -35,6 +33,9 @@ STALE_NO_WIP = "stale_no_wip"
 WAITING_DECISION = "waiting-decision"
 ACCEPTED_ISSUES = "accepted-issues"
 
+# Number of (project, report section) queries run at the same time. Also
+# the limit of concurrent requests, the queries don't start nested pools
+GATHER_WORKERS = 8
 
 
 def get_waiting_users(issue):
@@ -56,23 +57,16 @@ def get_staled_no_wip_merge_requests(project_id: int):
     return get_staled_merge_requests(project_id, 'no')
 
 
-def send_report_to_user(username, notify_dict, slack_user_data):
+def send_report_to_user(username, notify_dict, dispatcher: SlackDispatcher):
     text = "H0L4! Este es tu reporte que te da tu amigo, gorrabot :gorrabot2:!\n"
-    send_message_to_user(username, text, slack_user_data)
+    dispatcher.send(username, text)
     for user in notify_dict:
-        time.sleep(1)
         report = create_report(notify_dict, user)
-        send_message_to_user(username, report, slack_user_data)
-
+        dispatcher.send(username, report)
 
-def gather_data(notify_dict:dict, project_id:str, user):
-    can_send_message = check_can_send_slack_messages(project_id)
 
-    if not can_send_message:
-        # project cannot send messages to Slack
-        return
-
-    checking_functions = [
+def get_checking_functions():
+    return [
         {"elem_picker": get_staled_wip_merge_requests, "user_picker": get_slack_user_from_mr_or_issue,
          "key": STALE_WIP},
         {"elem_picker": get_staled_no_wip_merge_requests, "user_picker": get_slack_user_from_mr_or_issue,
@@ -81,26 +75,52 @@ def gather_data(notify_dict:dict, project_id:str, user):
         {"elem_picker": get_accepted_issues, "user_picker": get_slack_user_from_mr_or_issue, "key": ACCEPTED_ISSUES}
     ]
 
-    for function_dict in checking_functions:
-        for elem in function_dict["elem_picker"](project_id):
-            if user is not None:
-                notify_dict[username][function_dict["key"]].append(elem)
-            else:
-                usernames = function_dict["user_picker"](elem)
 
-                for username in usernames:
-                    if username not in OLD_MEMBERS:
-                        notify_dict[username][function_dict["key"]].append(elem)
+def pick_elems(elem_picker, project_id):
+    return list(elem_picker(project_id))
 
 
+def gather_data(notify_dict: dict, project_ids: list, user):
+    """Run every checking function of every project concurrently, and add
+    the results to notify_dict in project order"""
+    project_ids = [
+        project_id for project_id in project_ids
+        # projects that cannot send messages to Slack are skipped
+        if check_can_send_slack_messages(project_id)
+    ]
+    checking_functions = get_checking_functions()
+    old_members = compiled_config().gitlab.old_members
+
+    with ContextThreadPoolExecutor(max_workers=GATHER_WORKERS) as executor:
+        results = [
+            (function_dict, executor.submit(pick_elems, function_dict["elem_picker"], project_id))
+            for project_id in project_ids
+            for function_dict in checking_functions
+        ]
+        # notify_dict is only modified from this thread
+        for function_dict, future in results:
+            for elem in future.result():
+                if user is not None:
+                    notify_dict[user][function_dict["key"]].append(elem)
+                else:
+                    usernames = function_dict["user_picker"](elem)
+
+                    for username in usernames:
+                        if username not in old_members:
+                            notify_dict[username][function_dict["key"]].append(elem)
+
+
+@operation('slack_resume')
 def main(user=None, project=None):
+    bootstrap()
     notify_dict = defaultdict(lambda: {STALE_WIP: [], STALE_NO_WIP: [], WAITING_DECISION: [], ACCEPTED_ISSUES: []})
-    slack_user_data = get_slack_user_data()
+    settings = compiled_config().gitlab
+    dispatcher = SlackDispatcher(get_slack_user_index())
     if project is not None:
-        gather_data(notify_dict, project, user)
+        gather_data(notify_dict, [project], user)
     else:
-        for project_id in project_ids:
-            gather_data(notify_dict, project_id, user)
+        project_ids = [project.id for project in compiled_config().projects.values() if project.id is not None]
+        gather_data(notify_dict, project_ids, user)
 
     for username in notify_dict:
         if username is None:
@@ -122,8 +142,8 @@ def main(user=None, project=None):
             send = True
         else:
             text += "No tenes MR sin WIP/Draft estancados :ditto:!\n"
-        if len(notify_dict[username][ACCEPTED_ISSUES]) > MAX_ISSUES_ACCEPTED:
-            text += f":x: Tenes mas de {MAX_ISSUES_ACCEPTED} issues en 'Accepted', fijate:\n"
+        if len(notify_dict[username][ACCEPTED_ISSUES]) > settings.max_issues_accepted:
+            text += f":x: Tenes mas de {settings.max_issues_accepted} issues en 'Accepted', fijate:\n"
             text = "+ ".join([text] + [url['web_url'] + "\n" for url in notify_dict[username][ACCEPTED_ISSUES]])
             send = True
         if len(notify_dict[username][WAITING_DECISION]) > 0:
@@ -133,9 +153,10 @@ def main(user=None, project=None):
         text += "Nos vemos en el proximo reporte :ninja:"
 
         if send and DRY_RUN is None:
-            send_message_to_user(username, text, slack_user_data)
-    for username in REPORT_USERS:
-        send_report_to_user(username, notify_dict, slack_user_data)
+            dispatcher.send(username, text)
+    for username in settings.report_users:
+        send_report_to_user(username, notify_dict, dispatcher)
+    dispatcher.flush()
 
 
 if __name__ == '__main__':
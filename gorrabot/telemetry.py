@@ -0,0 +1,110 @@
+"""Attribution of the GitLab and Slack requests to what caused them.
+
+Handling an event or running a cron job is an operation. The requests
+made while it runs, also from the thread pools it uses, are added to its
+stats, and a summary is logged when it finishes.
+"""
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_operation = contextvars.ContextVar('gorrabot_operation', default=None)
+_in_thread_pool = contextvars.ContextVar('gorrabot_in_thread_pool', default=False)
+
+# Operation of the requests made outside any operation
+NO_OPERATION = 'other'
+
+
+class OperationStats:
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        # service -> [requests, seconds, bytes]
+        self.services = {}
+
+    def record(self, service: str, seconds: float, size: int):
+        with self._lock:
+            stats = self.services.setdefault(service, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += size
+
+
+@contextmanager
+def operation(name: str):
+    """Attribute the requests made inside to the operation name. Can also
+    be used as a decorator"""
+    stats = OperationStats(name)
+    token = _current_operation.set(stats)
+    start = time.monotonic()
+    try:
+        yield stats
+    finally:
+        _current_operation.reset(token)
+        usage = ', '.join(
+            f"{requests} {service} requests in {seconds:.2f}s ({size} bytes)"
+            for service, (requests, seconds, size) in sorted(stats.services.items())
+        )
+        logger.info(f"{name} finished in {time.monotonic() - start:.2f}s: {usage or 'no requests'}")
+
+
+def current_operation() -> OperationStats:
+    return _current_operation.get()
+
+
+def current_operation_name() -> str:
+    stats = _current_operation.get()
+    return stats.name if stats is not None else NO_OPERATION
+
+
+def _run_in_thread_pool(fn, *args, **kwargs):
+    _in_thread_pool.set(True)
+    return fn(*args, **kwargs)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks run in a copy of the context of the
+    thread that submits them, so they belong to the same operation"""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, _run_in_thread_pool, fn, *args, **kwargs)
+
+
+def parallelism(max_workers: int) -> int:
+    """Workers to use for a nested concurrent step. Inside a task of a
+    thread pool the work runs serially, so the outermost pool is the only
+    limit of concurrent requests"""
+    return 1 if _in_thread_pool.get() else max_workers
+
+
+def bounded_map(function, items, max_workers: int):
+    """Like map, but items are consumed lazily and at most max_workers
+    calls are in flight. Yields (item, result) in the order of items"""
+    max_workers = parallelism(max_workers)
+    if max_workers <= 1:
+        for item in items:
+            yield item, function(item)
+        return
+    items = iter(items)
+    pending = deque()
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                for item in itertools.islice(items, max_workers - len(pending)):
+                    pending.append((item, executor.submit(function, item)))
+                if not pending:
+                    return
+                item, future = pending.popleft()
+                yield item, future.result()
+        finally:
+            # The consumer may stop before the last item
+            for _, future in pending:
+                future.cancel()
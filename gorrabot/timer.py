@@ -24,7 +24,7 @@ class GorrabotTimer:
     def _run(self):
         self.is_running = False
         self.start()
-        logger.info("cleaning cache")
+        logger.info(f"Running {self.function.__name__}")
         self.function()
 
     def start(self):
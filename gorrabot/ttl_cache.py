@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after ``ttl`` seconds.
+
+    When more than ``maxsize`` entries are stored, the oldest ones are
+    dropped first.
+    """
+
+    _missing = object()
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._expire(time.monotonic())
+            expires_at, value = self._data.get(key, (None, default))
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._data.pop(key, None)
+            self._data[key] = (now + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value=True) -> bool:
+        """Set the key only if it isn't already stored, return whether it
+        was set"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if key in self._data:
+                return False
+            self._data[key] = (now + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            expires_at, value = self._data.pop(key, (None, default))
+            return value
+
+    def __contains__(self, key):
+        return self.get(key, self._missing) is not self._missing
+
+    def __len__(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
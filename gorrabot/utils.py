@@ -5,15 +5,19 @@ import re
 
 from gorrabot.api.gitlab import GitlabLabels
 from gorrabot.api.gitlab.branches import get_branch
-from gorrabot.api.gitlab.issues import get_issue, get_issues
-from gorrabot.api.gitlab.merge_requests import update_mr, get_merge_requests, get_mr_last_commit
+from gorrabot.api.gitlab.issues import get_issue, iter_issues
+from gorrabot.api.gitlab.last_commit_cache import last_commit_cache
+from gorrabot.api.gitlab.merge_requests import update_mr, iter_merge_requests, get_mr_last_commit
 from gorrabot.api.gitlab.projects import get_project_name
 from gorrabot.api.utils import parse_api_date
-from gorrabot.config import config
-from gorrabot.constants import regex_dict, decision_issue_message_interval, inactivity_time
+from gorrabot.config import compiled_config
+from gorrabot.telemetry import bounded_map
 import json
 logger = logging.getLogger(__name__)
 
+# Number of merge requests whose last commit is looked up at the same time
+LAST_COMMIT_WORKERS = 8
+
 
 def has_label(obj, label_name):
     return any(label['title'] == label_name
@@ -21,30 +25,27 @@ def has_label(obj, label_name):
 
 
 def has_flag(project_name, passed_flag):
-    has_flag_attr = 'flags' in config()['projects'][project_name]
+    project = compiled_config().projects[project_name]
     param_list = ['NO_CHANGELOG', 'NO_PRIORITY', 'NO_SEVERITY']
-    has_passed_flag = False
 
-    if not has_flag_attr:
+    if not project.has_flags:
         logger.warning("'Flags' attribute not detected. Proceeding to verify there is changelog")
-        return has_flag_attr and has_passed_flag
+        return False
 
-    if passed_flag in param_list:
-        selected_flag = param_list[param_list.index(passed_flag)]
-        has_passed_flag = selected_flag in [flag.upper() for flag in config()['projects'][project_name]['flags']]
-    else:
+    if passed_flag not in param_list:
         logger.warning('Passed flag was not recognized. Proceeding to verify there is changelog')
+        return False
 
-    return has_flag_attr and has_passed_flag
+    return passed_flag in project.flags
 
 
 def get_related_issue_iid(mr: dict):
     branch = mr['source_branch'] if "source_branch" in mr else mr["object_attributes"]["source_branch"]
     project_id = mr["project_id"] if "project_id" in mr else mr["project"]["id"]
     project_name = get_project_name(project_id)
-    branch_regex = regex_dict[project_name]
+    branch_regex = compiled_config().branch_regex(project_name)
     try:
-        iid = re.match(branch_regex, branch).group('iid')
+        iid = branch_regex.match(branch).group('iid')
     except (IndexError, AttributeError):
         return
 
@@ -120,8 +121,8 @@ def get_decision_issues(project_id: int):
         'labels': 'waiting-decision',
         'per_page': 100,
     }
-    issues = get_issues(project_id, filters)
-    for issue in issues:
+    decision_issue_message_interval = compiled_config().gitlab.decision_issue_message_interval
+    for issue in iter_issues(project_id, filters):
         if GitlabLabels.DONT_RUSH_ME in issue['labels']:
             continue
         updated_at = parse_api_date(issue['updated_at'])
@@ -140,6 +141,22 @@ def get_waiting_users_from_issue(issue):
     return users
 
 
+def get_mr_last_activity(mr: dict) -> datetime.datetime:
+    """Date of the last commit of the MR, or its creation date if it
+    has no commits"""
+    sha = mr.get('sha')
+    created_at = last_commit_cache.get(sha) if sha else None
+    if created_at is None:
+        last_commit = get_mr_last_commit(mr)
+        if last_commit is None:
+            # There is no activity in the MR, use the MR's creation date
+            return parse_api_date(mr['created_at'])
+        created_at = last_commit['created_at']
+        if sha:
+            last_commit_cache.set(sha, created_at)
+    return parse_api_date(created_at)
+
+
 def get_staled_merge_requests(project_id: int, wip=None):
     filters = {
         'scope': 'all',
@@ -147,27 +164,25 @@ def get_staled_merge_requests(project_id: int, wip=None):
         'state': 'opened',
         'per_page': 100,
     }
-    mrs = get_merge_requests(project_id, filters)
-    for mr in mrs:
-        if GitlabLabels.DONT_RUSH_ME in mr['labels']:
-            continue
-        if mr['source_branch'] and mr['source_branch'].startswith('exp_'):
-            continue
-        last_commit = get_mr_last_commit(mr)
-        if last_commit is None:
-            # There is no activity in the MR, use the MR's creation date
-            created_at = parse_api_date(mr['created_at'])
-        else:
-            created_at = parse_api_date(last_commit['created_at'])
-        if datetime.datetime.utcnow() - created_at > inactivity_time:
-            yield mr
+    candidates = (
+        mr for mr in iter_merge_requests(project_id, filters)
+        if GitlabLabels.DONT_RUSH_ME not in mr['labels']
+        and not (mr['source_branch'] and mr['source_branch'].startswith('exp_'))
+    )
+    inactivity_time = compiled_config().gitlab.inactivity_time
+    try:
+        for mr, last_activity in bounded_map(get_mr_last_activity, candidates, LAST_COMMIT_WORKERS):
+            if datetime.datetime.utcnow() - last_activity > inactivity_time:
+                yield mr
+    finally:
+        last_commit_cache.save()
 
 
 def get_push_info(push, branch_name):
     """ Gets several attributes from the PR's json """
     project_name = push["repository"]["name"]
-    branch_regex = regex_dict[project_name]
-    issue_iid = re.match(branch_regex, branch_name).group("iid")
+    branch_regex = compiled_config().branch_regex(project_name)
+    issue_iid = branch_regex.match(branch_name).group("iid")
     project_id = push['project_id']
 
     push_info = {
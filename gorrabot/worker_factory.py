@@ -1,20 +1,161 @@
+import logging
+import os
 import threading
+import zlib
 from queue import Queue
-buffer = Queue()
+
+from gorrabot.metrics import Gauge, failed_events
+from gorrabot.persistent_queue import MAX_ATTEMPTS, EventStore
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('GORRABOT_WORKERS', 4))
+# When set, accepted events are journaled in this SQLite file and replayed
+# after a restart
+QUEUE_PATH = os.environ.get('GORRABOT_QUEUE_PATH')
+
+
+def shard_key(event: dict) -> str:
+    """Events with the same key must be handled in order, by the same worker.
+
+    MR events are keyed by (project_id, iid), pushes by (project_id, branch)
+    """
+    if event.get('object_kind') == 'merge_request':
+        project_id = event.get('project', {}).get('id')
+        iid = event.get('object_attributes', {}).get('iid')
+        return f"{project_id}:mr:{iid}"
+    if event.get('object_kind') == 'push':
+        return f"{event.get('project_id')}:ref:{event.get('ref')}"
+    return str(event.get('object_kind'))
+
+
+class Job:
+    __slots__ = ('event', 'event_id')
+
+    def __init__(self, event: dict, event_id: int = None):
+        self.event = event
+        self.event_id = event_id
+
+
+class ShardedBuffer:
+    """Set of queues, one per worker, that routes each event by its shard key.
+
+    If a store is given, events are journaled there when they are put and
+    removed once they are acknowledged. Failed events stay in the journal
+    to be replayed on the next startup, unless a newer event with the same
+    shard key makes them outdated.
+    """
+
+    def __init__(self, shards: int, store: EventStore = None):
+        self.queues = [Queue() for _ in range(max(shards, 1))]
+        self.store = store
+        self._lock = threading.Lock()
+        # shard key -> id of the newest journaled event, while it's not
+        # finished
+        self._newest = {}
+        # shard key -> id of the failed event kept for replay
+        self._failed = {}
+
+    def dispatch(self, job: Job):
+        # zlib.crc32 instead of hash() so routing doesn't depend on the
+        # process hash seed
+        shard = zlib.crc32(shard_key(job.event).encode()) % len(self.queues)
+        self.queues[shard].put(job)
+
+    def journal(self, event: dict) -> Job:
+        """Journal the event, without queueing it yet"""
+        if self.store is None:
+            return Job(event)
+        event_id = self.store.add(event)
+        self._track(shard_key(event), event_id)
+        return Job(event, event_id)
+
+    def _track(self, key: str, event_id: int):
+        with self._lock:
+            self._newest[key] = event_id
+            outdated = self._failed.pop(key, None)
+        if outdated is not None:
+            logger.info(f"Not replaying failed event {outdated}, a newer event with the same key arrived")
+            self.store.ack(outdated)
+
+    def _finish(self, job: Job) -> bool:
+        """Stop tracking the job, return whether it's still the newest
+        event of its shard key"""
+        key = shard_key(job.event)
+        with self._lock:
+            if self._newest.get(key) != job.event_id:
+                return False
+            del self._newest[key]
+            return True
+
+    def put(self, event: dict):
+        self.dispatch(self.journal(event))
+
+    def ack(self, job: Job):
+        if self.store is not None and job.event_id is not None:
+            self._finish(job)
+            self.store.ack(job.event_id)
+
+    def fail(self, job: Job):
+        """Keep the failed job in the journal, for the next startup, unless
+        a newer event made it outdated or it failed MAX_ATTEMPTS times.
+        It isn't retried right away: the handler has side effects, like
+        comments, that would be repeated"""
+        if self.store is None or job.event_id is None:
+            return
+        if not self._finish(job):
+            logger.info(f"Not replaying failed event {job.event_id}, a newer event with the same key arrived")
+            self.store.ack(job.event_id)
+        elif self.store.fail(job.event_id):
+            logger.error(f"Dropping event {job.event_id} after {MAX_ATTEMPTS} failed attempts")
+        else:
+            with self._lock:
+                self._failed[shard_key(job.event)] = job.event_id
+
+    def replay(self):
+        """Queue again the events that a previous process didn't finish"""
+        if self.store is None:
+            return 0
+        orphans = self.store.claim_orphans()
+        for event_id, event in orphans:
+            self._track(shard_key(event), event_id)
+            self.dispatch(Job(event, event_id))
+        if orphans:
+            logger.info(f"Replaying {len(orphans)} unfinished events")
+        return len(orphans)
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+
+buffer = ShardedBuffer(WORKERS, EventStore(QUEUE_PATH) if QUEUE_PATH else None)
+Gauge('gorrabot_queued_events', 'Events waiting for a worker', buffer.qsize)
 
 
 class Worker(threading.Thread):
-    def __init__(self, buffer, handler):
+    def __init__(self, buffer: ShardedBuffer, handler, shard: int = 0):
         super().__init__(daemon=True)
         self.buffer = buffer
+        self.queue = buffer.queues[shard]
         self.handler = handler
         self.start()
 
     def run(self):
         while True:
-            data = self.buffer.get()
+            job = self.queue.get()
             try:
-                self.handler(data)
+                self.handler(job.event)
             except Exception:
-                pass
-            self.buffer.task_done()
+                kind = job.event.get('object_kind')
+                logger.exception(f"Error handling {kind} event")
+                failed_events.inc(kind=kind)
+                self.buffer.fail(job)
+            else:
+                self.buffer.ack(job)
+            self.queue.task_done()
+
+
+def start_workers(buffer: ShardedBuffer, handler):
+    workers = [Worker(buffer=buffer, handler=handler, shard=shard) for shard in range(len(buffer.queues))]
+    buffer.replay()
+    return workers